@@ -0,0 +1,391 @@
+import fcntl
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+
+LOCAL_MAX_BYTES: int = 16 * 1024 * 1024
+# Сколько секунд процесс верит своей копии, не спрашивая общий кэш.
+LOCAL_TIMEOUT: int = 5
+# Сколько секунд после истечения значение ещё отдаётся, пока его
+# пересчитывает один процесс.
+STALE_TIMEOUT: int = 60
+LOCK_TIMEOUT: int = 30
+LOCK_POLL: float = 0.05
+
+# Как у LocMemCache: экземпляры бэкенда свои в каждом потоке, а память
+# процесса у них общая.
+_local_caches = {}
+_local_caches_lock = threading.Lock()
+
+
+class LocalLRU:
+    """LRU в памяти процесса, ограниченный суммарным размером значений.
+
+    Значения хранятся в pickle: размер известен точно, а изменение
+    полученного объекта не портит кэш.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            data, expires = entry
+            if expires < time.monotonic():
+                self._pop(key)
+                return None
+            self.entries.move_to_end(key)
+        return pickle.loads(data)
+
+    def set(self, key, value, timeout):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self._pop(key)
+            if len(data) > self.max_bytes:
+                return
+            self.entries[key] = (data, time.monotonic() + timeout)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+
+class CacheLocks:
+    """Блокировки через add() общего кэша.
+
+    В memcached, redis и LocMemCache add() атомарен.
+    """
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+
+    def acquire(self, key):
+        return caches[self.alias].add(f'{key}:lock', 1, self.timeout)
+
+    def release(self, key):
+        caches[self.alias].delete(f'{key}:lock')
+
+    def is_locked(self, key):
+        return caches[self.alias].get(f'{key}:lock') is not None
+
+
+class FileLocks:
+    """Блокировки flock на файлах рядом с файловым кэшем.
+
+    add() файлового кэша — проверка и запись без блокировки, его
+    может выиграть несколько процессов сразу. flock атомарен и
+    снимается сам, если процесс упал.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.held = {}
+
+    def path(self, key):
+        name = hashlib.md5(key.encode()).hexdigest()
+        return os.path.join(self.directory, f'{name}.lock')
+
+    def acquire(self, key):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # Владелец мог снять блокировку и удалить файл, пока мы
+            # его открывали: такой файл уже ничего не защищает.
+            if os.fstat(fd).st_ino != os.stat(path).st_ino:
+                raise BlockingIOError
+        except (BlockingIOError, FileNotFoundError):
+            os.close(fd)
+            return False
+        self.held[key] = fd
+        return True
+
+    def release(self, key):
+        fd = self.held.pop(key, None)
+        if fd is None:
+            return
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+        finally:
+            os.close(fd)
+
+    def is_locked(self, key):
+        try:
+            fd = os.open(self.path(key), os.O_RDWR)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кэш: LRU в процессе поверх общего кэша.
+
+    Общий кэш — другой alias из CACHES (OPTIONS['SHARED']): файловый
+    локально, memcached или redis в бою. В нём значение лежит вместе
+    со сроком свежести и живёт ещё STALE_TIMEOUT секунд после него.
+    Истёкшее значение пересчитывает один процесс, взявший блокировку,
+    остальные до записи нового получают старое. Своей копии процесс
+    верит не дольше LOCAL_TIMEOUT: удаление и clear() в другом
+    процессе видны с такой задержкой. Ключи с префиксами из
+    LOCAL_EXCLUDE в памяти процесса не хранятся. Блокировку, после
+    которой значение так и не записали, снимает close() в конце
+    запроса.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        with _local_caches_lock:
+            self.local = _local_caches.setdefault(location, LocalLRU(
+                options.get('LOCAL_MAX_BYTES', LOCAL_MAX_BYTES)
+            ))
+        self.local_timeout = options.get('LOCAL_TIMEOUT', LOCAL_TIMEOUT)
+        self.local_exclude = tuple(options.get('LOCAL_EXCLUDE', ()))
+        self.stale_timeout = options.get('STALE_TIMEOUT', STALE_TIMEOUT)
+        self.lock_timeout = options.get('LOCK_TIMEOUT', LOCK_TIMEOUT)
+        self.held_locks = set()
+        self._locks = None
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    @property
+    def locks(self):
+        if self._locks is None:
+            shared = self.shared
+            if isinstance(shared, FileBasedCache):
+                self._locks = FileLocks(os.path.join(shared._dir, 'locks'))
+            else:
+                self._locks = CacheLocks(self.shared_alias, self.lock_timeout)
+        return self._locks
+
+    def _key(self, key, version):
+        """Полный ключ и можно ли держать значение в памяти процесса."""
+        full_key = self.make_key(key, version=version)
+        self.validate_key(full_key)
+        return full_key, not key.startswith(self.local_exclude)
+
+    def _is_stale(self, expires):
+        return expires is not None and expires < time.time()
+
+    def _shared_timeout(self, expires):
+        if expires is None:
+            return None
+        return max(expires - time.time(), 0) + self.stale_timeout
+
+    def _remember(self, key, envelope, local):
+        expires = envelope[1]
+        timeout = self.local_timeout
+        if expires is not None:
+            timeout = min(timeout, expires - time.time())
+        if local and timeout > 0:
+            self.local.set(key, envelope, timeout)
+
+    def _lookup(self, key, local):
+        envelope = self.local.get(key) if local else None
+        if envelope is None:
+            envelope = self.shared.get(key)
+            if envelope is not None:
+                self._remember(key, envelope, local)
+        return envelope
+
+    def _acquire(self, key):
+        if self.locks.acquire(key):
+            self.held_locks.add(key)
+            return True
+        return False
+
+    def _release(self, key):
+        if key in self.held_locks:
+            self.held_locks.discard(key)
+            self.locks.release(key)
+
+    def _value(self, key, envelope, default):
+        """Значение конверта; истёкшее — тоже, если пересчитывает другой."""
+        value, expires = envelope
+        if self._is_stale(expires) and self._acquire(key):
+            # Этому вызывающему — промах: он пересчитает и запишет.
+            return default
+        return value
+
+    def _store(self, key, value, timeout, local):
+        expires = self.get_backend_timeout(timeout)
+        if expires is not None and expires <= time.time():
+            self._delete(key)
+            return
+        envelope = (value, expires)
+        self.shared.set(key, envelope, self._shared_timeout(expires))
+        self._remember(key, envelope, local)
+        self._release(key)
+
+    def _delete(self, key):
+        self.local.delete(key)
+        self.shared.delete(key)
+        self._release(key)
+
+    def get(self, key, default=None, version=None):
+        key, local = self._key(key, version)
+        envelope = self._lookup(key, local)
+        if envelope is None:
+            return default
+        return self._value(key, envelope, default)
+
+    def get_many(self, keys, version=None):
+        full_keys = {}
+        for key in keys:
+            full_key, local = self._key(key, version)
+            full_keys[full_key] = (local, key)
+        found, missing = {}, []
+        for full_key, (local, _) in full_keys.items():
+            envelope = self.local.get(full_key) if local else None
+            if envelope is None:
+                missing.append(full_key)
+            else:
+                found[full_key] = envelope
+        for full_key, envelope in self.shared.get_many(missing).items():
+            self._remember(full_key, envelope, full_keys[full_key][0])
+            found[full_key] = envelope
+        result = {}
+        for full_key, envelope in found.items():
+            value = self._value(full_key, envelope, self)
+            if value is not self:
+                result[full_keys[full_key][1]] = value
+        return result
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT,
+                   version=None):
+        """Как в BaseCache, но значение вычисляет только один процесс.
+
+        При промахе остальные ждут его записи до LOCK_TIMEOUT секунд,
+        при истёкшем значении — получают старое.
+        """
+        full_key, local = self._key(key, version)
+        envelope = self._lookup(full_key, local)
+        if envelope is not None:
+            value, expires = envelope
+            if not self._is_stale(expires) or not self._acquire(full_key):
+                return value
+        elif not self._acquire(full_key):
+            envelope = self._wait(full_key, local)
+            if envelope is not None:
+                return envelope[0]
+        try:
+            value = default() if callable(default) else default
+            if value is not None:
+                self._store(full_key, value, timeout, local)
+        finally:
+            self._release(full_key)
+        return value
+
+    def _wait(self, key, local):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            envelope = self._lookup(key, local)
+            if envelope is not None:
+                return envelope
+            if not self.locks.is_locked(key):
+                break
+        return None
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key, local = self._key(key, version)
+        self._store(key, value, timeout, local)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        envelopes = {}
+        for key, value in data.items():
+            full_key, local = self._key(key, version)
+            envelopes[full_key] = (value, expires)
+            self._remember(full_key, envelopes[full_key], local)
+        self.shared.set_many(envelopes, self._shared_timeout(expires))
+        for full_key in envelopes:
+            self._release(full_key)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key, local = self._key(key, version)
+        envelope = (value, self.get_backend_timeout(timeout))
+        if not self.shared.add(
+            key, envelope, self._shared_timeout(envelope[1])
+        ):
+            return False
+        self._remember(key, envelope, local)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key, local = self._key(key, version)
+        envelope = self.shared.get(key)
+        if envelope is None:
+            return False
+        self._store(key, envelope[0], timeout, local)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        # Как и в файловом кэше, приращение не атомарно между процессами.
+        key, local = self._key(key, version)
+        envelope = self.shared.get(key)
+        if envelope is None:
+            raise ValueError("Key '%s' not found" % key)
+        value, expires = envelope
+        envelope = (value + delta, expires)
+        self.shared.set(key, envelope, self._shared_timeout(expires))
+        self._remember(key, envelope, local)
+        return envelope[0]
+
+    def delete(self, key, version=None):
+        key, _ = self._key(key, version)
+        self._delete(key)
+
+    def delete_many(self, keys, version=None):
+        full_keys = [self._key(key, version)[0] for key in keys]
+        for key in full_keys:
+            self.local.delete(key)
+        self.shared.delete_many(full_keys)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        for key in list(self.held_locks):
+            self._release(key)
@@ -0,0 +1,74 @@
+import re
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .routers import mark_synced
+
+PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+def get_pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', {})
+
+
+def pragma_statements(pragmas):
+    """PRAGMA-запросы по настройкам.
+
+    Параметры запроса в PRAGMA не подставляются, поэтому имена и
+    значения проверяются по шаблону.
+    """
+    statements = []
+    for name, value in pragmas.items():
+        if not PRAGMA_NAME.match(name) or not PRAGMA_VALUE.match(str(value)):
+            raise ImproperlyConfigured(
+                f'Недопустимая настройка SQLite: {name} = {value!r}'
+            )
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    """Настраивает каждое новое соединение с SQLite по SQLITE_PRAGMAS."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(get_pragmas()):
+            cursor.execute(statement)
+
+
+def copy_database(source, path):
+    """Копия базы SQLite соединения source в файле path.
+
+    Backup API копирует согласованный снимок, пока в базу пишут, и
+    сам ждёт читателей копии.
+    """
+    source.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        source.connection.backup(target)
+    finally:
+        target.close()
+
+
+def replicate(alias):
+    """Обновляет реплику SQLite копией основной базы.
+
+    Замена настоящей репликации для локального запуска. Время снимка
+    берётся до копирования: в автокоммите версии кэша выдаются после
+    коммита, поэтому реплика содержит все записи с версией не новее
+    отметки.
+    """
+    version = time.time_ns()
+    copy_database(
+        connections[DEFAULT_DB_ALIAS], connections[alias].settings_dict['NAME']
+    )
+    mark_synced(alias, version)
+    return version
@@ -0,0 +1,125 @@
+import contextlib
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+WRITE_COOKIE = 'last_write'
+# Реплика, не синхронизированная дольше, для чтения не используется.
+MAX_LAG: int = 30
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = threading.local()
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def synced_key(alias):
+    return f'core:replica:{alias}'
+
+
+def mark_synced(alias, version):
+    """Реплика содержит все записи, закоммиченные до time_ns() == version."""
+    cache.set(synced_key(alias), version, None)
+
+
+def get_max_lag():
+    return getattr(settings, 'DATABASE_REPLICA_MAX_LAG', MAX_LAG)
+
+
+def choose_replica(min_version=0):
+    """Случайная реплика, догнавшая min_version, или None."""
+    replicas = get_replicas()
+    if not replicas:
+        return None
+    max_lag = get_max_lag()
+    min_version = max(min_version, time.time_ns() - max_lag * 10 ** 9)
+    synced = cache.get_many([synced_key(alias) for alias in replicas])
+    fresh = [
+        alias for alias in replicas
+        if synced.get(synced_key(alias), -1) >= min_version
+    ]
+    return random.choice(fresh) if fresh else None
+
+
+def last_write(request):
+    """Время (time_ns) последней записи пользователя из куки."""
+    try:
+        return int(request.COOKIES.get(WRITE_COOKIE, 0))
+    except ValueError:
+        return 0
+
+
+@contextlib.contextmanager
+def use_replica(request, min_version=0):
+    """Чтения внутри блока идут на реплику.
+
+    Реплика берётся только для GET и HEAD, если она догнала
+    min_version — версию кэша страницы — и последнюю запись
+    пользователя. Иначе, как и после первой записи внутри блока,
+    чтения идут на основную базу.
+    """
+    alias = None
+    if request.method in ('GET', 'HEAD'):
+        alias = choose_replica(max(min_version, last_write(request)))
+    previous = getattr(_state, 'alias', None)
+    _state.alias = alias
+    try:
+        yield alias
+    finally:
+        _state.alias = previous
+
+
+class ReplicaRouter:
+    """Запись — в основную базу, чтение в use_replica — с реплик.
+
+    Схема и данные попадают на реплики репликацией, миграции к ним не
+    применяются.
+    """
+
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'alias', None) or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Свои записи запрос дальше читает с основной базы.
+        _state.alias = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На всех базах одни и те же данные.
+        aliases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if {obj1._state.db, obj2._state.db} <= aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in get_replicas()
+
+
+class PrimaryPinMiddleware:
+    """После запроса с записью закрепляет пользователя за основной базой.
+
+    В куке — время записи; use_replica берёт только реплики, скопированные
+    позже, и пользователь видит свои изменения. Кука живёт MAX_LAG:
+    потом более старые реплики отсеивает сама choose_replica.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and get_replicas():
+            response.set_cookie(
+                WRITE_COOKIE,
+                str(time.time_ns()),
+                max_age=get_max_lag(),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,173 @@
+import logging
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.defaultfilters import date as date_filter
+from django.urls import (
+    NoReverseMatch, get_script_prefix, get_urlconf, reverse
+)
+from django.utils.html import format_html, format_html_join
+from django.utils.http import RFC3986_SUBDELIMS
+from django.utils.safestring import mark_safe
+from django.utils.timezone import template_localtime
+
+from . import thumbnails
+from .utils import feed_version_key, get_versions
+
+logger = logging.getLogger(__name__)
+
+CARD_TIMEOUT: int = 24 * 60 * 60
+CARD_IMAGE_CLASS = 'card-img my-2'
+IMAGE_SIZES = '(max-width: 960px) 100vw, 960px'
+# Значения-заглушки, подходящие под конвертеры str, slug и int.
+URL_PLACEHOLDERS = ('urlplaceholder', 9876543210)
+
+Card = namedtuple('Card', 'post html detail_url group_url')
+
+
+@lru_cache(maxsize=None)
+def _url_pattern(name, urlconf, script_prefix):
+    for placeholder in URL_PLACEHOLDERS:
+        try:
+            url = reverse(name, args=(placeholder,), urlconf=urlconf)
+        except NoReverseMatch:
+            continue
+        parts = url.split(str(placeholder))
+        if len(parts) == 2:
+            return tuple(parts)
+    raise ValueError(f'URL {name} не принимает один аргумент')
+
+
+def fast_reverse(name, arg):
+    """reverse() для URL с одним аргументом без обхода URLconf.
+
+    Шаблон URL разбирается один раз, дальше аргумент подставляется
+    с тем же экранированием, что делает reverse().
+    """
+    prefix, suffix = _url_pattern(
+        name, get_urlconf(settings.ROOT_URLCONF), get_script_prefix()
+    )
+    return prefix + quote(str(arg), safe=RFC3986_SUBDELIMS + '/~:@') + suffix
+
+
+def srcset(variants):
+    return ', '.join(
+        f'{thumbnail.url} {width}w' for width, thumbnail in variants
+    )
+
+
+def render_picture(post, variants, css_class=CARD_IMAGE_CLASS):
+    """<picture> с вариантами картинки поста разной ширины и формата.
+
+    Пока картинка грузится, на её месте виден цвет и размытое превью,
+    сохранённые в посте при загрузке.
+    """
+    fallback = variants[thumbnails.IMAGE_FORMATS[-1]]
+    width, thumbnail = fallback[-1]
+    style = 'height: auto;'
+    if post.image_color:
+        style += f' background-color: {post.image_color};'
+    if post.image_placeholder:
+        style += (f' background-image: url({post.image_placeholder});'
+                  ' background-size: cover;')
+    return format_html(
+        '<picture>{}<img class="{}" src="{}" srcset="{}" sizes="{}" '
+        'width="{}" height="{}" style="{}" loading="lazy" alt=""></picture>',
+        format_html_join(
+            '', '<source type="image/{}" srcset="{}" sizes="{}">',
+            (
+                (image_format.lower(), srcset(variants[image_format]),
+                 IMAGE_SIZES)
+                for image_format in thumbnails.IMAGE_FORMATS[:-1]
+            )
+        ),
+        css_class,
+        thumbnail.url,
+        srcset(fallback),
+        IMAGE_SIZES,
+        width,
+        thumbnails.get_height(width),
+        style,
+    )
+
+
+def render_card(post, variants=None):
+    """Карточка поста в ленте: автор, дата, счётчик, картинка и текст."""
+    picture = ''
+    if post.image and variants:
+        picture = render_picture(post, variants)
+    return format_html(
+        '<ul><li>Автор: {}<br><a href="{}">все посты пользователя</a></li>'
+        '<li>Дата публикации: {}</li><li>Комментариев: {}</li></ul>'
+        '{}<p>{}</p>',
+        post.author.get_full_name(),
+        fast_reverse('posts:profile', post.author.username),
+        date_filter(template_localtime(post.pub_date), 'd E Y'),
+        post.comments_count,
+        picture,
+        post.text,
+    )
+
+
+def get_cards_version():
+    """Общая версия карточек: в них имя автора и ссылка на профиль.
+
+    Её сдвигает переименование пользователя (posts.signals).
+    """
+    key = feed_version_key('all')
+    return get_versions([key])[key]
+
+
+def card_key(post, cards_version):
+    return f'posts:card:{cards_version}:{post.pk}:{post.version}'
+
+
+def _load_variants(posts):
+    names = [post.image.name for post in posts if post.image]
+    if not names:
+        return {}
+    try:
+        return thumbnails.get_many_variants(names)
+    except Exception:
+        # Как и {% thumbnail %}, не роняем страницу из-за картинок.
+        logger.exception('Не удалось получить миниатюры %s', names)
+        return {}
+
+
+def get_cards(posts):
+    """Карточки постов страницы вместе со ссылками на пост и группу.
+
+    Готовый HTML карточек читается из кэша одним get_many. Для
+    промахов миниатюры всей страницы берутся из kvstore одной пачкой,
+    ссылки строятся по заранее разобранным шаблонам URL.
+    """
+    posts = list(posts)
+    cards_version = get_cards_version()
+    keys = [card_key(post, cards_version) for post in posts]
+    html = cache.get_many(keys)
+    missing = [post for post, key in zip(posts, keys) if key not in html]
+    if missing:
+        variants = _load_variants(missing)
+        rendered = {
+            card_key(post, cards_version): str(render_card(
+                post, variants.get(post.image.name) if post.image else None
+            ))
+            for post in missing
+        }
+        cache.set_many(rendered, CARD_TIMEOUT)
+        html.update(rendered)
+    return [
+        Card(
+            post=post,
+            html=mark_safe(html[key]),
+            detail_url=fast_reverse('posts:post_detail', post.pk),
+            group_url=(
+                fast_reverse('posts:group_list', post.group.slug)
+                if post.group_id else None
+            ),
+        )
+        for post, key in zip(posts, keys)
+    ]
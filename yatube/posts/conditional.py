@@ -0,0 +1,120 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.core.cache import cache
+from django.views.decorators.http import condition
+
+from core.routers import use_replica
+
+from .models import Group, Post, User
+from .utils import feed_version_key, get_versions
+
+LOOKUP_TIMEOUT: int = 60 * 60
+
+
+def lookup_key(key):
+    return f'posts:lookup:{key}'
+
+
+def cached_lookup(key, queryset):
+    """Кэширует первичный ключ, по которому строятся ключи версий.
+
+    Записи сбрасывают сигналы posts.signals при переименовании и
+    удалении групп, пользователей и постов.
+    """
+    return cache.get_or_set(lookup_key(key), queryset.first, LOOKUP_TIMEOUT)
+
+
+def forget_lookups(keys):
+    cache.delete_many([lookup_key(key) for key in keys])
+
+
+def feed_condition(get_keys):
+    """ETag и Last-Modified страницы по версиям её ключей кэша.
+
+    get_keys(request, *args, **kwargs) возвращает ключи версий
+    страницы или None, если страницы нет. Страница не рендерится:
+    при совпадении валидатора клиент получает 304 Not Modified.
+    """
+    def get_page_versions(request, *args, **kwargs):
+        if not hasattr(request, '_page_versions'):
+            keys = get_keys(request, *args, **kwargs)
+            request._page_versions = None if keys is None else get_versions(
+                [feed_version_key('all')] + keys
+            )
+        return request._page_versions
+
+    def etag(request, *args, **kwargs):
+        versions = get_page_versions(request, *args, **kwargs)
+        if versions is None:
+            return None
+        raw = '|'.join([
+            str(request.user.pk),
+            request.get_full_path(),
+            *(f'{key}={versions[key]}' for key in sorted(versions)),
+        ])
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        # Вёрстка зависит от пользователя, поэтому дата изменения
+        # отдаётся только анонимам; остальным хватает ETag.
+        if request.user.is_authenticated:
+            return None
+        versions = get_page_versions(request, *args, **kwargs)
+        if versions is None:
+            return None
+        return datetime.fromtimestamp(
+            max(versions.values()) / 10 ** 9, tz=timezone.utc
+        )
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def read_from_replica(view):
+    """View читает с реплики, если та догнала версии страницы.
+
+    Версии берутся из feed_condition: страница с реплики совпадает с
+    тем, что обещают её ETag и запись в кэше страниц.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        versions = getattr(request, '_page_versions', None) or {}
+        with use_replica(request, max(versions.values(), default=0)):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def index_keys(request):
+    return [feed_version_key('index')]
+
+
+def group_keys(request, slug):
+    group_id = cached_lookup(
+        f'group:{slug}',
+        Group.objects.filter(slug=slug).values_list('pk', flat=True)
+    )
+    return None if group_id is None else [feed_version_key('group', group_id)]
+
+
+def profile_keys(request, username):
+    author_id = cached_lookup(
+        f'user:{username}',
+        User.objects.filter(username=username).values_list('pk', flat=True)
+    )
+    if author_id is None:
+        return None
+    return [feed_version_key('author', author_id)]
+
+
+def post_keys(request, post_id):
+    author_id = cached_lookup(
+        f'post:{post_id}',
+        Post.objects.filter(pk=post_id).values_list('author_id', flat=True)
+    )
+    if author_id is None:
+        return None
+    return [
+        feed_version_key('post', post_id),
+        feed_version_key('author', author_id),
+    ]
@@ -0,0 +1,122 @@
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Comment, Follow, Post, User, UserStats
+
+BATCH_SIZE: int = 500
+
+
+def shift_user_stats(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя выражениями F().
+
+    Если строки ещё нет, она создаётся с посчитанными значениями —
+    но только при росте счётчика: при удалениях пользователь может
+    быть уже удалён каскадом. Разошедшийся счётчик не уходит ниже нуля.
+    """
+    updated = UserStats.objects.filter(user_id=user_id).update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+    if not updated and any(delta > 0 for delta in deltas.values()):
+        UserStats.objects.get_or_create(
+            user_id=user_id, defaults=UserStats.count_for(user_id)
+        )
+
+
+def shift_comments_count(post_id, delta):
+    if post_id is not None:
+        Post.objects.filter(pk=post_id).update(
+            # Ниже нуля не даёт CHECK у PositiveIntegerField.
+            comments_count=Greatest(F('comments_count') + delta, 0),
+            updated_at=timezone.now(),
+        )
+
+
+def _batches(queryset, batch_size):
+    last_pk = 0
+    while True:
+        pks = list(
+            queryset.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return
+        yield pks
+        last_pk = pks[-1]
+
+
+def _grouped_counts(queryset, field, pks):
+    return dict(
+        queryset.filter(**{f'{field}__in': pks})
+        .values_list(field)
+        .annotate(count=Count('pk'))
+        .order_by()
+    )
+
+
+def reconcile_user_stats(batch_size=BATCH_SIZE, user_ids=None):
+    """Исправляет расхождения счётчиков пользователей, возвращает их число.
+
+    user_ids ограничивает проверку этими пользователями.
+    """
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    repaired = 0
+    for pks in _batches(users, batch_size):
+        with transaction.atomic():
+            posts = _grouped_counts(Post.objects, 'author_id', pks)
+            followers = _grouped_counts(Follow.objects, 'author_id', pks)
+            following = _grouped_counts(Follow.objects, 'user_id', pks)
+            existing = UserStats.objects.select_for_update().in_bulk(pks)
+            changed, created = [], []
+            for pk in pks:
+                actual = {
+                    'posts_count': posts.get(pk, 0),
+                    'followers_count': followers.get(pk, 0),
+                    'following_count': following.get(pk, 0),
+                }
+                stats = existing.get(pk)
+                if stats is None:
+                    created.append(UserStats(user_id=pk, **actual))
+                    continue
+                if any(
+                    getattr(stats, field) != value
+                    for field, value in actual.items()
+                ):
+                    for field, value in actual.items():
+                        setattr(stats, field, value)
+                    changed.append(stats)
+            UserStats.objects.bulk_create(created, ignore_conflicts=True)
+            UserStats.objects.bulk_update(
+                changed,
+                ['posts_count', 'followers_count', 'following_count'],
+            )
+        repaired += len(changed) + len(created)
+    return repaired
+
+
+def reconcile_comments_count(batch_size=BATCH_SIZE):
+    """Исправляет расхождения счётчиков комментариев, возвращает их число."""
+    repaired = 0
+    for pks in _batches(Post.objects.all(), batch_size):
+        with transaction.atomic():
+            comments = _grouped_counts(Comment.objects, 'post_id', pks)
+            changed = []
+            now = timezone.now()
+            for post in Post.objects.filter(pk__in=pks).only(
+                'comments_count'
+            ):
+                actual = comments.get(post.pk, 0)
+                if post.comments_count != actual:
+                    post.comments_count = actual
+                    post.updated_at = now
+                    changed.append(post)
+            Post.objects.bulk_update(
+                changed, ['comments_count', 'updated_at']
+            )
+        repaired += len(changed)
+    return repaired
@@ -0,0 +1,230 @@
+import collections
+import contextlib
+import datetime
+import gzip
+import json
+import os
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from . import counters, search, timeline
+from .follow_feed import get_engine
+from .models import Comment, Follow, Group, Post, User
+
+FORMAT_VERSION: int = 1
+MANIFEST = 'manifest.json'
+# Строк в одном файле: столько держит в памяти процесс восстановления.
+CHUNK_ROWS: int = 50000
+READ_CHUNK: int = 2000
+
+
+class DumpEncoder(DjangoJSONEncoder):
+    """Даты пишутся с микросекундами: DjangoJSONEncoder их обрезает."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class DumpError(ValueError):
+    """Выгрузку нельзя восстановить в эту базу."""
+
+
+def get_models():
+    """Модели в порядке зависимостей: сначала те, на кого ссылаются."""
+    return [User, Group, Post, Comment, Follow]
+
+
+def _attnames(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def dump_model(model, directory, chunk_rows=CHUNK_ROWS):
+    """Пишет таблицу в файлы <модель>-NNNNN.ndjson.gz по chunk_rows строк.
+
+    Каждая строка файла — JSON-массив значений полей в порядке fields
+    из манифеста.
+    """
+    fields = _attnames(model)
+    rows = model._default_manager.order_by('pk').values_list(*fields)
+    files = []
+    target = None
+    count = 0
+    try:
+        for row in rows.iterator(chunk_size=READ_CHUNK):
+            if count % chunk_rows == 0:
+                if target is not None:
+                    target.close()
+                files.append(
+                    f'{model._meta.label_lower}-{len(files) + 1:05}.ndjson.gz'
+                )
+                target = gzip.open(
+                    os.path.join(directory, files[-1]), 'wt', encoding='utf-8'
+                )
+            target.write(json.dumps(
+                row, cls=DumpEncoder, separators=(',', ':')
+            ))
+            target.write('\n')
+            count += 1
+    finally:
+        if target is not None:
+            target.close()
+    return {
+        'model': model._meta.label_lower,
+        'fields': fields,
+        'files': files,
+        'rows': count,
+    }
+
+
+def dump(directory, chunk_rows=CHUNK_ROWS):
+    """Выгружает посты, группы, комментарии, подписки и пользователей.
+
+    Манифест пишется последним: прерванная выгрузка его не содержит.
+    Производные данные — ленты, счётчики пользователей, поисковый
+    индекс — не выгружаются и пересчитываются при восстановлении.
+    """
+    os.makedirs(directory, exist_ok=True)
+    # Одна транзакция — один согласованный снимок всех таблиц.
+    with transaction.atomic():
+        models = [
+            dump_model(model, directory, chunk_rows) for model in get_models()
+        ]
+    with open(os.path.join(directory, MANIFEST), 'w') as target:
+        json.dump({'version': FORMAT_VERSION, 'models': models}, target)
+    return models
+
+
+def read_chunk(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as source:
+        return [json.loads(line) for line in source]
+
+
+def _imap_bounded(executor, func, items, window):
+    """Как executor.map, но заданий в работе не больше window."""
+    pending = collections.deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+@contextlib.contextmanager
+def deferred_indexes(tables):
+    """Снимает вторичные индексы таблиц и создаёт их заново в конце.
+
+    Построить индекс один раз по готовой таблице быстрее, чем
+    обновлять его на каждой вставке. Индексы уникальности и первичных
+    ключей остаются. Работает только для SQLite.
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+            "AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%%' "
+            "AND tbl_name IN ({})".format(', '.join(['%s'] * len(tables))),
+            tables
+        )
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for _, sql in indexes:
+                cursor.execute(sql)
+
+
+def _insert_sql(model, fields):
+    quote = connection.ops.quote_name
+    columns = [model._meta.get_field(name).column for name in fields]
+    return 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+
+
+def _prepare(fields, row):
+    return [
+        field.get_db_prep_value(field.to_python(value), connection)
+        for field, value in zip(fields, row)
+    ]
+
+
+def restore_model(entry, directory, executor=None, window=1):
+    model = apps.get_model(entry['model'])
+    fields = [
+        next(field for field in model._meta.concrete_fields
+             if field.attname == name)
+        for name in entry['fields']
+    ]
+    sql = _insert_sql(model, entry['fields'])
+    paths = [os.path.join(directory, name) for name in entry['files']]
+    if executor is None:
+        chunks = map(read_chunk, paths)
+    else:
+        chunks = _imap_bounded(executor, read_chunk, paths, window)
+    for rows in chunks:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, [_prepare(fields, row) for row in rows])
+
+
+def load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as source:
+            manifest = json.load(source)
+    except FileNotFoundError:
+        raise DumpError(
+            f'В {directory} нет {MANIFEST}: выгрузка не закончена'
+        )
+    if manifest.get('version') != FORMAT_VERSION:
+        raise DumpError(
+            f'Неизвестная версия выгрузки {manifest.get("version")}'
+        )
+    return manifest
+
+
+def restore(directory, executor=None, window=1):
+    """Загружает выгрузку в пустые таблицы.
+
+    Файлы распаковываются и разбираются в executor, вставка идёт в
+    текущем процессе: писатель в SQLite всё равно один. В памяти
+    одновременно не больше window файлов.
+    """
+    manifest = load_manifest(directory)
+    models = [apps.get_model(entry['model']) for entry in manifest['models']]
+    for model in models:
+        if model._default_manager.exists():
+            raise DumpError(
+                f'Таблица {model._meta.db_table} не пуста, восстанавливать '
+                'можно только в чистую базу'
+            )
+    with deferred_indexes([model._meta.db_table for model in models]):
+        for entry in manifest['models']:
+            restore_model(entry, directory, executor, window)
+    finish_restore(models)
+    return manifest['models']
+
+
+def finish_restore(models):
+    """Пересчитывает то, что не входит в выгрузку."""
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+    search.rebuild(Post.objects.all())
+    counters.reconcile_user_stats()
+    if get_engine() == 'timeline':
+        timeline.rebuild()
+    # В кэше счётчики, версии и страницы прежней базы.
+    cache.clear()
@@ -0,0 +1,120 @@
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+
+from . import conditional
+from .models import Group, Post, User
+from .page_cache import cache_anonymous_page
+from .utils import LAST_NUM_POSTS
+
+FEED_ITEMS: int = LAST_NUM_POSTS * 2
+
+
+class PostsFeed(Feed):
+    """Общая часть RSS-лент постов.
+
+    Ответ помечается теми же ключами версий, что и HTML-страница
+    ленты, поэтому кэш и ETag сбрасываются вместе с ней.
+    """
+
+    get_keys = None
+
+    def __call__(self, request, *args, **kwargs):
+        response = super().__call__(request, *args, **kwargs)
+        response.surrogate_keys = self.get_keys(request, *args, **kwargs)
+        return response
+
+    def get_queryset(self, obj):
+        """Посты объекта ленты — группы или автора."""
+        return obj.posts
+
+    def items(self, obj):
+        return self.get_queryset(obj).for_feed()[:FEED_ITEMS]
+
+    def item_title(self, item):
+        return item.text[:50]
+
+    def item_description(self, item):
+        return item.text
+
+    def item_link(self, item):
+        return reverse('posts:post_detail', args=(item.pk,))
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+
+class IndexFeed(PostsFeed):
+    title = 'Yatube: последние обновления'
+    description = 'Последние посты на сайте.'
+    get_keys = staticmethod(conditional.index_keys)
+
+    def link(self):
+        return reverse('posts:index')
+
+    def get_queryset(self, obj):
+        return Post.objects
+
+
+class GroupFeed(PostsFeed):
+    get_keys = staticmethod(conditional.group_keys)
+
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def title(self, obj):
+        return f'Yatube: {obj.title}'
+
+    def description(self, obj):
+        return obj.description
+
+    def link(self, obj):
+        return reverse('posts:group_list', args=(obj.slug,))
+
+
+class ProfileFeed(PostsFeed):
+    get_keys = staticmethod(conditional.profile_keys)
+
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, obj):
+        return f'Yatube: {obj.get_full_name() or obj.username}'
+
+    def description(self, obj):
+        return f'Посты пользователя {obj.username}.'
+
+    def link(self, obj):
+        return reverse('posts:profile', args=(obj.username,))
+
+
+class AtomMixin:
+    """Та же лента в формате Atom."""
+
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj=None):
+        return self._get_dynamic_attr('description', obj)
+
+
+class IndexAtomFeed(AtomMixin, IndexFeed):
+    pass
+
+
+class GroupAtomFeed(AtomMixin, GroupFeed):
+    pass
+
+
+class ProfileAtomFeed(AtomMixin, ProfileFeed):
+    pass
+
+
+def feed_view(feed_class):
+    """View ленты с ETag/Last-Modified и кэшем для анонимов."""
+    return conditional.feed_condition(feed_class.get_keys)(
+        cache_anonymous_page(feed_class())
+    )
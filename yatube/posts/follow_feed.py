@@ -0,0 +1,98 @@
+import heapq
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Follow, Post
+from .utils import CURSOR_FIELDS
+
+RECENT_POSTS_PER_AUTHOR: int = 200
+RECENT_POSTS_TIMEOUT: int = 60 * 60
+# Ключ курсора ленты timeline — поля записи Timeline, а не поста.
+TIMELINE_CURSOR_FIELDS = ('timeline_entries__pub_date', 'timeline_entries__pk')
+
+
+def get_engine():
+    """Движок ленты подписок: join, timeline или pull."""
+    return getattr(settings, 'POSTS_FOLLOW_FEED_ENGINE', 'timeline')
+
+
+def recent_posts_key(author_id):
+    return f'posts:recent:{author_id}'
+
+
+def load_recent_posts(author_id):
+    return list(
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date', '-pk')
+        .values_list('pub_date', 'pk')[:RECENT_POSTS_PER_AUTHOR]
+    )
+
+
+def refresh_recent_posts(author_id):
+    """Перечитывает в кэш ключи (pub_date, id) свежих постов автора."""
+    cache.set(
+        recent_posts_key(author_id),
+        load_recent_posts(author_id),
+        RECENT_POSTS_TIMEOUT,
+    )
+
+
+def get_recent_posts(author_ids):
+    """Списки свежих постов авторов; промахи кэша дочитываются из БД."""
+    keys = {recent_posts_key(author_id): author_id for author_id in author_ids}
+    found = cache.get_many(keys)
+    missing = {
+        key: load_recent_posts(author_id)
+        for key, author_id in keys.items() if key not in found
+    }
+    if missing:
+        cache.set_many(missing, RECENT_POSTS_TIMEOUT)
+    found.update(missing)
+    return list(found.values())
+
+
+class MergedFeed:
+    """Лента, собранная слиянием кэшированных списков постов авторов.
+
+    От каждого автора в ленте не больше RECENT_POSTS_PER_AUTHOR
+    последних постов. Посты страницы загружаются одним in_bulk.
+    """
+
+    def __init__(self, author_ids):
+        merged = heapq.merge(*get_recent_posts(author_ids), reverse=True)
+        self.post_ids = [pk for _, pk in merged]
+
+    def __len__(self):
+        return len(self.post_ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        post_ids = self.post_ids[index]
+        posts = Post.objects.for_feed().in_bulk(post_ids)
+        return [posts[pk] for pk in post_ids if pk in posts]
+
+
+def get_follow_feed(user):
+    """Посты авторов, на которых подписан user, движком из настроек."""
+    engine = get_engine()
+    if engine == 'pull':
+        return MergedFeed(
+            Follow.objects.filter(user=user).values_list(
+                'author_id', flat=True
+            )
+        )
+    if engine == 'join':
+        return Post.objects.filter(author__following__user=user).for_feed()
+    # Сортировка по полям Timeline читает готовый диапазон индекса
+    # (user, pub_date) без сортировки постов.
+    return Post.objects.filter(timeline_entries__user=user).for_feed(
+    ).order_by(*(f'-{field}' for field in TIMELINE_CURSOR_FIELDS))
+
+
+def get_cursor_fields():
+    """Поля ключа курсора для ленты get_follow_feed."""
+    if get_engine() == 'timeline':
+        return TIMELINE_CURSOR_FIELDS
+    return CURSOR_FIELDS
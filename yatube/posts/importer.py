@@ -0,0 +1,336 @@
+import csv
+import json
+from itertools import islice
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, search, timeline
+from .follow_feed import get_engine, refresh_recent_posts
+from .models import (
+    Comment, Follow, Group, ImportCheckpoint, ImportedPost, Post, User
+)
+from .utils import bump_feed_versions, feed_count_key, feed_version_key
+
+BATCH_SIZE: int = 1000
+
+
+class RowError(ValueError):
+    """Строку нельзя импортировать; импорт остальных продолжается."""
+
+
+def read_rows(path, file_format):
+    """Построчно читает JSONL или CSV, отдаёт пары (номер строки, dict)."""
+    with open(path, encoding='utf-8', newline='') as source:
+        if file_format == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as error:
+                yield line_number, RowError(f'битый JSON: {error}')
+
+
+def get_position(source):
+    """Последняя записанная строка импорта source или None."""
+    return ImportCheckpoint.objects.filter(source=source).values_list(
+        'line', flat=True
+    ).first()
+
+
+def reserve_pks(model, count):
+    """Первый из count подряд идущих свободных id модели.
+
+    Вызывается в транзакции пачки после первой записи: SQLite держит
+    блокировку записи до коммита, и сайт не займёт выданные id. Как и
+    AUTOINCREMENT, не выдаёт заново id удалённых строк.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT seq FROM sqlite_sequence WHERE name = %s',
+            [model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    last_pk = model.objects.aggregate(Max('pk'))['pk__max'] or 0
+    return max(last_pk, row[0] if row else 0) + 1
+
+
+class ContentImporter:
+    """Пишет посты, комментарии и подписки пачками через bulk_create.
+
+    Авторы и группы ищутся по таблицам в памяти. У SQLite bulk_create
+    не возвращает первичные ключи, а они нужны, чтобы сослаться на
+    пост из того же файла и вернуть дату, перетёртую auto_now_add,
+    поэтому id пачки резервируются в её транзакции. В той же
+    транзакции пишутся позиция в файле, id постов из файла, счётчики
+    пользователей и ленты подписчиков: после сбоя импорт продолжается
+    с первой незаписанной строки, ничего не повторяя.
+    """
+
+    def __init__(self, source, batch_size=BATCH_SIZE, create_users=False):
+        self.source = source
+        self.batch_size = batch_size
+        self.create_users = create_users
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.created = {'post': 0, 'comment': 0, 'follow': 0}
+
+    def run(self, rows, on_batch=None):
+        """Импортирует строки пачками, каждая пачка — одна транзакция.
+
+        on_batch(line_number, errors) вызывается после коммита пачки.
+        """
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            errors = self.write_batch(batch)
+            if on_batch is not None:
+                on_batch(batch[-1][0], errors)
+
+    def get_imported_posts(self, batch):
+        """{id в файле: id в базе} постов из прошлых пачек, нужных пачке.
+
+        Соответствие хранится в ImportedPost, а не в памяти: её расход
+        не растёт с размером файла.
+        """
+        external_ids = set()
+        for _, row in batch:
+            if isinstance(row, dict):
+                field = 'post' if row.get('type') == 'comment' else 'id'
+                external_ids.add(str(row.get(field) or ''))
+        external_ids.discard('')
+        if not external_ids:
+            return {}
+        return dict(
+            ImportedPost.objects.filter(
+                source=self.source, external_id__in=external_ids
+            ).values_list('external_id', 'post_id')
+        )
+
+    def build(self, batch):
+        """Разбирает строки пачки; посты и комментарии — ещё без id."""
+        posts, comments, follows, errors = [], [], [], []
+        imported = self.get_imported_posts(batch)
+        # Посты пачки получат id только при записи.
+        pending = set()
+        for line_number, row in batch:
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                if not isinstance(row, dict):
+                    raise RowError('строка не объект JSON')
+                kind = row.get('type')
+                if kind == 'post':
+                    posts.append(self.build_post(row, imported, pending))
+                elif kind == 'comment':
+                    comments.append(
+                        self.build_comment(row, imported, pending)
+                    )
+                elif kind == 'follow':
+                    follows.append(self.build_follow(row))
+                else:
+                    raise RowError(f'неизвестный тип {kind!r}')
+            except RowError as error:
+                errors.append((line_number, str(error)))
+        return posts, comments, follows, errors
+
+    def write_batch(self, batch):
+        posts, comments, follows, errors = self.build(batch)
+        with transaction.atomic():
+            # Первая запись берёт блокировку записи SQLite до коммита.
+            self.save_position(batch[-1][0])
+            post_ids = self.assign_pks(Post, posts)
+            for external_id, comment in comments:
+                if comment.post_id is None:
+                    comment.post_id = post_ids[external_id]
+            self.assign_pks(Comment, comments)
+            posts = [post for _, post in posts]
+            comments = [comment for _, comment in comments]
+            self.save(Post, posts)
+            ImportedPost.objects.bulk_create(
+                ImportedPost(source=self.source, external_id=external_id,
+                             post_id=pk)
+                for external_id, pk in post_ids.items()
+            )
+            self.save(Comment, comments)
+            self.count_comments(comments)
+            Follow.objects.bulk_create(follows, ignore_conflicts=True)
+            search.index_new_posts([(post.pk, post.text) for post in posts])
+            self.update_followers(posts, follows)
+        self.forget_feeds(posts)
+        self.created['post'] += len(posts)
+        self.created['comment'] += len(comments)
+        self.created['follow'] += len(follows)
+        return errors
+
+    def save_position(self, line_number):
+        if not ImportCheckpoint.objects.filter(source=self.source).update(
+            line=line_number
+        ):
+            ImportCheckpoint.objects.create(
+                source=self.source, line=line_number
+            )
+
+    def assign_pks(self, model, objects):
+        """Выдаёт объектам пачки id, возвращает {id в файле: id в базе}."""
+        if not objects:
+            return {}
+        first_pk = reserve_pks(model, len(objects))
+        ids = {}
+        for pk, (external_id, obj) in enumerate(objects, first_pk):
+            obj.pk = pk
+            if model is Post and external_id:
+                ids[external_id] = pk
+        return ids
+
+    def save(self, model, objects):
+        dates = [obj.pub_date for obj in objects]
+        # Размер запросов Django подбирает сам под лимиты базы.
+        model.objects.bulk_create(objects)
+        # auto_now_add перетирает дату из файла, возвращаем её одним
+        # executemany: bulk_update строит CASE на каждую строку и в разы
+        # медленнее.
+        field = model._meta.get_field('pub_date')
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'UPDATE {} SET {} = %s WHERE {} = %s'.format(
+                    quote(model._meta.db_table),
+                    quote(field.column),
+                    quote(model._meta.pk.column),
+                ),
+                [
+                    (field.get_db_prep_value(pub_date, connection), obj.pk)
+                    for obj, pub_date in zip(objects, dates)
+                ]
+            )
+        for obj, pub_date in zip(objects, dates):
+            obj.pub_date = pub_date
+
+    def count_comments(self, comments):
+        post_ids = {comment.post_id for comment in comments}
+        if not post_ids:
+            return
+        Post.objects.filter(pk__in=post_ids).update(
+            comments_count=Subquery(
+                Comment.objects.filter(post=OuterRef('pk'))
+                .values('post')
+                .annotate(count=Count('pk'))
+                .values('count')
+            ),
+            updated_at=timezone.now(),
+        )
+
+    def update_followers(self, posts, follows):
+        """То, что при bulk_create делали бы сигналы, — только для пачки."""
+        counters.reconcile_user_stats(user_ids={
+            user_id
+            for follow in follows
+            for user_id in (follow.user_id, follow.author_id)
+        } | {post.author_id for post in posts})
+        if get_engine() != 'timeline':
+            return
+        timeline.fan_out_posts(posts)
+        for follow in follows:
+            timeline.backfill(follow.user_id, follow.author_id)
+
+    def get_user_id(self, username):
+        if not username:
+            raise RowError('не указан пользователь')
+        if username not in self.users:
+            if not self.create_users:
+                raise RowError(f'нет пользователя {username!r}')
+            user = User(username=username)
+            user.set_unusable_password()
+            user.save()
+            self.users[username] = user.pk
+        return self.users[username]
+
+    def get_pub_date(self, row):
+        value = row.get('pub_date')
+        if not value:
+            return timezone.now()
+        try:
+            pub_date = parse_datetime(value)
+        except (TypeError, ValueError):
+            # Формат верный, но такой даты нет: 2020-13-45.
+            pub_date = None
+        if pub_date is None:
+            raise RowError(f'неверная дата {value!r}')
+        if timezone.is_naive(pub_date):
+            pub_date = timezone.make_aware(pub_date, timezone.utc)
+        return pub_date
+
+    def build_post(self, row, imported, pending):
+        external_id = str(row.get('id') or '')
+        if external_id in imported or external_id in pending:
+            raise RowError(f'повторный id поста {external_id!r}')
+        text = row.get('text')
+        if not text:
+            raise RowError('пустой текст поста')
+        group_id = None
+        if row.get('group'):
+            group_id = self.groups.get(row['group'])
+            if group_id is None:
+                raise RowError(f'нет группы {row["group"]!r}')
+        post = Post(
+            text=text,
+            author_id=self.get_user_id(row.get('author')),
+            group_id=group_id,
+            pub_date=self.get_pub_date(row),
+        )
+        if external_id:
+            pending.add(external_id)
+        return external_id, post
+
+    def build_comment(self, row, imported, pending):
+        external_id = str(row.get('post') or '')
+        if external_id not in imported and external_id not in pending:
+            raise RowError(f'нет поста {row.get("post")!r} в файле')
+        text = row.get('text')
+        if not text:
+            raise RowError('пустой текст комментария')
+        # Пост из этой же пачки получит id только при записи.
+        return external_id, Comment(
+            post_id=imported.get(external_id),
+            author_id=self.get_user_id(row.get('author')),
+            text=text,
+            pub_date=self.get_pub_date(row),
+        )
+
+    def build_follow(self, row):
+        user_id = self.get_user_id(row.get('user'))
+        author_id = self.get_user_id(row.get('author'))
+        if user_id == author_id:
+            raise RowError('подписка на самого себя')
+        return Follow(user_id=user_id, author_id=author_id)
+
+    def forget_feeds(self, posts):
+        """Сбрасывает кэши лент, в которые попали посты пачки."""
+        authors = {post.author_id for post in posts}
+        if get_engine() == 'pull':
+            for author_id in authors:
+                refresh_recent_posts(author_id)
+        cache.delete_many(
+            [feed_count_key('index')]
+            + [feed_count_key('author', pk) for pk in authors]
+            + [feed_count_key('group', post.group_id)
+               for post in posts if post.group_id is not None]
+        )
+
+    def finish(self):
+        """Выдаёт лентам новые версии и забывает позицию импорта."""
+        bump_feed_versions([feed_version_key('all')])
+        with transaction.atomic():
+            ImportedPost.objects.filter(source=self.source).delete()
+            ImportCheckpoint.objects.filter(source=self.source).delete()
@@ -0,0 +1,230 @@
+import shutil
+import tempfile
+import time
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import engines
+from django.template.loader import get_template
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from posts.follow_feed import get_follow_feed
+from posts.models import Follow, Group, Post, User, UserStats
+from posts.utils import FeedPaginator, get_feed_version
+
+# Карточка до перехода на posts.cards: include и {% url %} на каждый пост.
+LEGACY_CARD = """{% load post_images %}
+<ul>
+  <li>
+    Автор: {{ post.author.get_full_name }}<br>
+    <a href="{% url 'posts:profile' post.author.username %}"
+      >все посты пользователя</a>
+  </li>
+  <li>Дата публикации: {{ post.pub_date|date:"d E Y" }}</li>
+  <li>Комментариев: {{ post.comments_count }}</li>
+</ul>
+{% post_picture post %}
+<p>{{ post.text }}</p>"""
+# Страницы до перехода: тот же шаблон, но блок content с прежним циклом.
+LEGACY_PAGES = {
+    'index.html': """{% extends 'posts/index.html' %}{% load cache %}
+{% block content %}
+  <h1><span style="color:red">П</span>оследние обновления на сайте</h1>
+  {% include 'posts/includes/switcher.html' %}
+  {% cache None index_page feed_version page_obj.number page_obj.cursor %}
+    {% for post in page_obj %}
+      <article>
+        {% include card %}
+        <a href="{% url 'posts:post_detail' post.pk %}"
+          >подробная информация</a><br>
+        {% if post.group %}
+          <a href="{% url 'posts:group_list' post.group.slug %}"
+            >все записи группы</a>
+        {% endif %}
+      </article>
+      {% if not forloop.last %}<hr>{% endif %}
+    {% endfor %}
+  {% endcache %}
+  {% include 'posts/includes/paginator.html' %}
+{% endblock %}""",
+    'group_list.html': """{% extends 'posts/group_list.html' %}
+{% load cache %}
+{% block content %}
+  <h1>{{ group.title }}</h1>
+  <p>{{ group.description }}</p>
+  {% cache None group_page group.pk feed_version page_obj.number \
+page_obj.cursor %}
+    {% for post in page_obj %}
+      <article>
+        {% include card %}
+      </article>
+      {% if not forloop.last %}<hr>{% endif %}
+    {% endfor %}
+  {% endcache %}
+  {% include 'posts/includes/paginator.html' %}
+{% endblock %}""",
+    'profile.html': """{% extends 'posts/profile.html' %}{% load cache %}
+{% block content %}
+  {% include 'posts/includes/follow_unfollow.html' %}
+  {% cache None profile_page author.pk feed_version page_obj.number \
+page_obj.cursor %}
+    {% for post in page_obj %}
+      <article>
+        {% include card %}
+        <a href="{% url 'posts:post_detail' post.pk %}"
+          >подробная информация</a>
+      </article>
+      {% if post.group %}
+        <a href="{% url 'posts:group_list' post.group.slug %}"
+          >все записи группы</a>
+      {% endif %}
+      {% if not forloop.last %}<hr>{% endif %}
+    {% endfor %}
+  {% endcache %}
+  {% include 'posts/includes/paginator.html' %}
+{% endblock %}""",
+    'follow.html': """{% extends 'posts/follow.html' %}
+{% block content %}
+  <h1><span style="color:red">В</span>аша лента</h1>
+  {% include 'posts/includes/switcher.html' %}
+  {% for post in page_obj %}
+    <article>
+      {% include card %}
+      <a href="{% url 'posts:post_detail' post.pk %}"
+        >подробная информация</a><br>
+      {% if post.group %}
+        <a href="{% url 'posts:group_list' post.group.slug %}"
+          >все записи группы</a>
+      {% endif %}
+    </article>
+    {% if not forloop.last %}<hr>{% endif %}
+  {% endfor %}
+  {% include 'posts/includes/paginator.html' %}
+{% endblock %}""",
+}
+IMAGE = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C\x0A\x00\x3B'
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время рендера страниц лент: шаблоны с include и '
+        '{% url %} на каждый пост против posts.cards, кэши выключены. '
+        'Данные создаются во временной транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts',
+            type=int,
+            default=10,
+            help='Постов на странице.'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=200,
+            help='Сколько раз рендерить каждую страницу.'
+        )
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp()
+        caches = {
+            # Кэш карточек выключен: меряем рендер, а не чтение кэша.
+            'default': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+            },
+            'thumbnails': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+        }
+        with override_settings(MEDIA_ROOT=media_root, CACHES=caches,
+                               THUMBNAIL_CACHE='thumbnails',
+                               POSTS_THUMBNAIL_WORKERS=0):
+            try:
+                with transaction.atomic():
+                    self.run(options['posts'], options['repeat'])
+                    raise Rollback
+            except Rollback:
+                pass
+            finally:
+                shutil.rmtree(media_root, ignore_errors=True)
+
+    def create_posts(self, count):
+        author = User.objects.create_user(username='benchmark_author')
+        group = Group.objects.create(title='Бенчмарк', slug='benchmark')
+        reader = User.objects.create_user(username='benchmark_reader')
+        Follow.objects.create(user=reader, author=author)
+        for number in range(count):
+            Post.objects.create(
+                author=author,
+                group=group,
+                text=f'Пост для замера {number}',
+                image=SimpleUploadedFile('bench.gif', IMAGE, 'image/gif'),
+            )
+        return author, group, reader
+
+    def get_pages(self, author, group, reader):
+        """Посты и контекст каждой страницы — как их собирает view."""
+        return {
+            'index.html': (Post.objects.for_feed(), {
+                'feed_version': get_feed_version('index'),
+            }),
+            'group_list.html': (group.posts.for_feed(), {
+                'group': group,
+                'feed_version': get_feed_version('group', group.pk),
+            }),
+            'profile.html': (author.posts.for_feed(), {
+                'author': author,
+                'author_stats': UserStats.objects.for_user(author),
+                'feed_version': get_feed_version('author', author.pk),
+                'following': True,
+            }),
+            'follow.html': (get_follow_feed(reader), {}),
+        }
+
+    def measure(self, template, context, request, repeat):
+        template.render(context, request)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            template.render(context, request)
+        return time.perf_counter() - started
+
+    def run(self, count, repeat):
+        author, group, reader = self.create_posts(count)
+        request = RequestFactory().get('/')
+        request.user = reader
+        engine = engines['django']
+        card = engine.from_string(LEGACY_CARD).template
+        self.stdout.write(
+            f'{"страница":<16}{"до, мкс":>12}{"после, мкс":>12}'
+            f'{"ускорение":>12}'
+        )
+        for page, (posts, context) in self.get_pages(
+            author, group, reader
+        ).items():
+            posts = list(posts[:count])
+            timings = []
+            for template, extra in (
+                (engine.from_string(LEGACY_PAGES[page]), {'card': card}),
+                (get_template(f'posts/{page}'), {}),
+            ):
+                page_obj = FeedPaginator(posts, count).get_page(1)
+                timings.append(self.measure(
+                    template, {**context, **extra, 'page_obj': page_obj},
+                    request, repeat
+                ) / repeat)
+            before, after = timings
+            self.stdout.write(
+                f'{page:<16}{before * 1e6:>12.1f}{after * 1e6:>12.1f}'
+                f'{before / after:>11.1f}x'
+            )
@@ -0,0 +1,152 @@
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+
+from core.db import pragma_statements
+from posts.models import Comment, Post, User
+
+# Настройки SQLite по умолчанию и соединение на каждый запрос.
+DEFAULT_MODE = {'journal_mode': 'delete', 'synchronous': 'full'}
+STARTUP_DELAY: float = 1.0
+SEED_USERS: int = 20
+SEED_POSTS: int = 200
+
+
+def work(role, pragmas, persistent, started, finished, post_ids, user_ids):
+    """Цикл одного процесса: пишет комментарии или читает ленту.
+
+    Без persistent соединение закрывается после каждой операции, как
+    при CONN_MAX_AGE = 0. Возвращает (role, операций, ошибок).
+    """
+    settings.SQLITE_PRAGMAS = pragmas
+    operations = errors = 0
+    time.sleep(max(started - time.time(), 0))
+    while time.time() < finished:
+        try:
+            if role == 'writer':
+                Comment.objects.create(
+                    post_id=random.choice(post_ids),
+                    author_id=random.choice(user_ids),
+                    text='Комментарий для замера',
+                )
+            else:
+                list(Post.objects.for_feed()[:10])
+                Post.objects.count()
+            operations += 1
+        except OperationalError:
+            # database is locked: писатель не дождался блокировки.
+            errors += 1
+        if not persistent:
+            connection.close()
+    connection.close()
+    return role, operations, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite с настройками по '
+        'умолчанию и с SQLITE_PRAGMAS и постоянными соединениями: '
+        'одни процессы пишут комментарии, другие читают ленту. Замер '
+        'идёт на временной копии схемы, рабочая база не меняется.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--writers',
+            type=int,
+            default=2,
+            help='Процессов, пишущих комментарии.'
+        )
+        parser.add_argument(
+            '--readers',
+            type=int,
+            default=4,
+            help='Процессов, читающих ленту.'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=5,
+            help='Длительность замера каждого режима, секунд.'
+        )
+
+    def handle(self, *args, **options):
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        original_name = connection.settings_dict['NAME']
+        connections.close_all()
+        connection.settings_dict['NAME'] = path
+        try:
+            call_command('migrate', verbosity=0)
+            post_ids, user_ids = self.seed()
+            modes = (
+                ('по умолчанию', DEFAULT_MODE, False),
+                ('SQLITE_PRAGMAS', settings.SQLITE_PRAGMAS, True),
+            )
+            for title, pragmas, persistent in modes:
+                self.report(title, self.run(
+                    options, pragmas, persistent, post_ids, user_ids
+                ), options['duration'])
+        finally:
+            connections.close_all()
+            connection.settings_dict['NAME'] = original_name
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    def seed(self):
+        users = User.objects.bulk_create(
+            User(username=f'benchmark_{number}')
+            for number in range(SEED_USERS)
+        )
+        user_ids = list(User.objects.values_list('pk', flat=True))
+        Post.objects.bulk_create(
+            Post(author_id=user_ids[number % len(users)],
+                 text=f'Пост для замера {number}')
+            for number in range(SEED_POSTS)
+        )
+        return list(Post.objects.values_list('pk', flat=True)), user_ids
+
+    def run(self, options, pragmas, persistent, post_ids, user_ids):
+        roles = (
+            ['writer'] * options['writers'] + ['reader'] * options['readers']
+        )
+        # journal_mode хранится в файле базы, переключаем его заранее:
+        # иначе процессы замера спорят за переключение.
+        with connection.cursor() as cursor:
+            for statement in pragma_statements(pragmas):
+                cursor.execute(statement)
+        # Дочерние процессы не должны делить соединение с родителем.
+        connections.close_all()
+        started = time.time() + STARTUP_DELAY
+        finished = started + options['duration']
+        with ProcessPoolExecutor(len(roles)) as pool:
+            return list(pool.map(
+                work, roles,
+                *(
+                    [value] * len(roles)
+                    for value in (pragmas, persistent, started, finished,
+                                  post_ids, user_ids)
+                )
+            ))
+
+    def report(self, title, results, duration):
+        totals = {}
+        for role, operations, errors in results:
+            total = totals.setdefault(role, [0, 0])
+            total[0] += operations
+            total[1] += errors
+        writes, write_errors = totals.get('writer', (0, 0))
+        reads, _ = totals.get('reader', (0, 0))
+        self.stdout.write(
+            f'{title}: записей {writes / duration:.0f}/с, '
+            f'чтений {reads / duration:.0f}/с, '
+            f'ошибок блокировки {write_errors}'
+        )
@@ -0,0 +1,80 @@
+import time
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+
+from posts import media_gc
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки, на которые не ссылается ни один пост, '
+        'и миниатюры без записи в хранилище ключей sorl.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=media_gc.BATCH_SIZE,
+            help='Сколько файлов проверять одним запросом.'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.5,
+            help='Пауза в секундах после каждой пачки с удалениями.'
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=media_gc.MIN_AGE,
+            help='Не трогать файлы моложе стольких секунд.'
+        )
+        parser.add_argument(
+            '--after',
+            help='Продолжить обход после этого пути из прошлого запуска.'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Остановиться после пачки, где набралось столько файлов.'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        limit = options['limit']
+        deleted = scanned = 0
+        last_name = None
+        batches = media_gc.collect(
+            after=options['after'],
+            batch_size=options['batch_size'],
+            min_age=options['min_age'],
+        )
+        for orphans, last_name, scanned in batches:
+            for name, kind in orphans:
+                if dry_run:
+                    self.stdout.write(f'{kind}: {name}')
+                    deleted += 1
+                elif media_gc.delete_orphan(name, kind, options['min_age']):
+                    deleted += 1
+            if limit and scanned >= limit:
+                self.stdout.write(
+                    f'Обход прерван, продолжить: --after {last_name}'
+                )
+                break
+            if orphans and not dry_run:
+                time.sleep(options['pause'])
+        else:
+            if not dry_run:
+                # Записи о миниатюрах исходников, удалённых в обход GC.
+                default.kvstore.cleanup()
+        verb = 'к удалению' if dry_run else 'удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено файлов: {scanned}, {verb}: {deleted}'
+        ))
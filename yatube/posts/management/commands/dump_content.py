@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import dump
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково выгружает пользователей, группы, посты, комментарии и '
+        'подписки в каталог сжатых NDJSON-файлов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог для выгрузки.')
+        parser.add_argument(
+            '--chunk-rows',
+            type=int,
+            default=dump.CHUNK_ROWS,
+            help='Сколько строк писать в один файл.'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        models = dump.dump(options['directory'], options['chunk_rows'])
+        for entry in models:
+            self.stdout.write(
+                f'{entry["model"]}: {entry["rows"]} строк, '
+                f'файлов: {len(entry["files"])}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгрузка готова за {time.monotonic() - started:.1f} с'
+        ))
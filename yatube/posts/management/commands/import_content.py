@@ -0,0 +1,86 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import importer
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково импортирует посты, комментарии и подписки из JSONL или '
+        'CSV. Каждая строка — объект с полем type: post, comment или follow.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .jsonl или .csv.')
+        parser.add_argument(
+            '--format',
+            choices=('jsonl', 'csv'),
+            help='Формат файла; по умолчанию — по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=importer.BATCH_SIZE,
+            help='Сколько строк писать в одной транзакции.'
+        )
+        parser.add_argument(
+            '--create-users',
+            action='store_true',
+            help='Создавать неизвестных пользователей без пароля.'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Продолжить прерванный импорт с последней пачки.'
+        )
+        parser.add_argument(
+            '--name',
+            help='Имя импорта для --resume; по умолчанию — полный путь файла.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or (
+            'csv' if path.lower().endswith('.csv') else 'jsonl'
+        )
+        source = options['name'] or os.path.abspath(path)
+        position = importer.get_position(source)
+        if position is not None and not options['resume']:
+            raise CommandError(
+                f'Импорт {source} прерван на строке {position}, '
+                'продолжите его с --resume'
+            )
+        position = position or 0
+        content = importer.ContentImporter(
+            source,
+            batch_size=options['batch_size'],
+            create_users=options['create_users'],
+        )
+        started = time.monotonic()
+        errors_count = 0
+
+        def remaining_rows():
+            for line_number, row in importer.read_rows(path, file_format):
+                if line_number > position:
+                    yield line_number, row
+
+        def on_batch(line_number, errors):
+            nonlocal errors_count
+            for error_line, message in errors:
+                self.stderr.write(f'Строка {error_line}: {message}')
+            errors_count += len(errors)
+            rate = (line_number - position) / max(
+                time.monotonic() - started, 1e-6
+            )
+            self.stdout.write(f'Строка {line_number}: {rate:.0f} строк/с')
+
+        content.run(remaining_rows(), on_batch)
+        content.finish()
+        created = content.created
+        self.stdout.write(self.style.SUCCESS(
+            f'Постов: {created["post"]}, комментариев: {created["comment"]}, '
+            f'подписок: {created["follow"]}, ошибок: {errors_count}, '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts.models import Post
+from posts.storage import is_content_name
+from posts.utils import bump_feed_versions, feed_version_key
+
+BATCH_SIZE: int = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов из плоского каталога в хранилище '
+        'с именами по хэшу содержимого и переписывает пути в Post.image.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Сколько постов обрабатывать в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        posts = Post.objects.exclude(image='').order_by('pk')
+        moved = missing = 0
+        last_pk = 0
+        while True:
+            rows = list(
+                posts.filter(pk__gt=last_pk)
+                .values_list('pk', 'image')[:options['batch_size']]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            renames = {}
+            for _, name in rows:
+                if is_content_name(name) or name in renames:
+                    continue
+                if not storage.exists(name):
+                    missing += 1
+                    continue
+                with storage.open(name) as image_file:
+                    renames[name] = storage.save(name, image_file)
+            with transaction.atomic():
+                for old_name, new_name in renames.items():
+                    Post.objects.filter(image=old_name).update(
+                        image=new_name, updated_at=timezone.now()
+                    )
+            # Старые файлы удаляем только после коммита новых путей.
+            for old_name in renames:
+                storage.delete(old_name)
+            moved += len(renames)
+        if moved:
+            # update() не вызывает сигналы, а в кэше страниц старые пути.
+            bump_feed_versions([feed_version_key('all')])
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов перенесено: {moved}, не найдено: {missing}'
+        ))
@@ -0,0 +1,51 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт отсутствующие и пересоздаёт устаревшие миниатюры '
+        'картинок постов параллельно в нескольких процессах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Число процессов; 1 — без пула, в текущем процессе.'
+        )
+
+    def handle(self, *args, **options):
+        names = (
+            Post.objects.exclude(image='')
+            # Сортировка по другому полю попала бы в DISTINCT, а один
+            # файл по хэшу бывает у многих постов.
+            .order_by('image')
+            .values_list('image', flat=True)
+            .distinct()
+            .iterator()
+        )
+        workers = max(options['workers'], 1)
+        if workers == 1:
+            counts = list(map(thumbnails.regenerate, names))
+        else:
+            names = list(names)
+            # Дочерние процессы не должны делить соединение с родителем.
+            connections.close_all()
+            pool = ProcessPoolExecutor(workers, initializer=django.setup)
+            with pool:
+                counts = list(
+                    pool.map(thumbnails.regenerate, names, chunksize=16)
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок проверено: {len(counts)}, '
+            f'миниатюр создано: {sum(counts)}'
+        ))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.db import replicate
+from core.routers import get_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в файлы реплик из '
+        'DATABASE_REPLICAS. Замена репликации для локального запуска: '
+        'с --interval копирует по кругу, пока команду не остановят.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Пауза между копированиями, секунд; 0 — скопировать раз.'
+        )
+
+    def handle(self, *args, **options):
+        replicas = get_replicas()
+        if not replicas:
+            raise CommandError('В DATABASE_REPLICAS нет реплик')
+        for alias in replicas:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'Реплика {alias} — не SQLite')
+        while True:
+            for alias in replicas:
+                started = time.perf_counter()
+                replicate(alias)
+                self.stdout.write(
+                    f'{alias}: скопирована за '
+                    f'{time.perf_counter() - started:.2f} с'
+                )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,44 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import dump
+
+
+class Command(BaseCommand):
+    help = (
+        'Восстанавливает выгрузку dump_content в пустую базу: пачками, '
+        'с отложенным созданием индексов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог с выгрузкой.')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Процессов для распаковки; 1 — без пула.'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        workers = max(options['workers'], 1)
+        try:
+            if workers == 1:
+                models = dump.restore(options['directory'])
+            else:
+                pool = ProcessPoolExecutor(workers, initializer=django.setup)
+                with pool:
+                    models = dump.restore(
+                        options['directory'], pool, window=workers + 1
+                    )
+        except dump.DumpError as error:
+            raise CommandError(error)
+        rows = sum(entry['rows'] for entry in models)
+        self.stdout.write(self.style.SUCCESS(
+            f'Строк восстановлено: {rows} за '
+            f'{time.monotonic() - started:.1f} с'
+        ))
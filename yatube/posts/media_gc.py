@@ -0,0 +1,137 @@
+import os
+import posixpath
+import time
+
+from django.conf import settings
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from .models import Post
+from .storage import locked_file
+
+BATCH_SIZE: int = 500
+# Файл могли записать, а пост ещё не сохранить: свежие файлы не трогаем.
+MIN_AGE: int = 24 * 60 * 60
+
+ORIGINAL = 'original'
+THUMBNAIL = 'thumbnail'
+
+
+def get_prefixes():
+    """Каталоги MEDIA_ROOT, которые обходит сборщик, и тип их файлов."""
+    image_dir = Post._meta.get_field('image').upload_to.strip('/')
+    thumbnail_dir = thumbnail_settings.THUMBNAIL_PREFIX.strip('/')
+    return {image_dir: ORIGINAL, thumbnail_dir: THUMBNAIL}
+
+
+def _sort_key(entry):
+    # Так порядок обхода совпадает с порядком строк полных путей.
+    return entry.name + '/' if entry.is_dir() else entry.name
+
+
+def _walk(path, relative, after):
+    try:
+        entries = sorted(os.scandir(path), key=_sort_key)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        name = posixpath.join(relative, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            if after is None or after < name + '/\U0010ffff':
+                yield from _walk(entry.path, name, after)
+        elif entry.is_file(follow_symlinks=False):
+            if after is None or name > after:
+                yield name, entry.stat().st_mtime
+
+
+def iter_files(root, prefixes, after=None):
+    """Файлы под root/<prefix> по возрастанию относительного пути.
+
+    Каталоги читаются по одному, поэтому память не зависит от числа
+    файлов. Пути не больше after пропускаются вместе с каталогами.
+    """
+    for prefix in sorted(prefixes, key=lambda prefix: prefix + '/'):
+        yield from _walk(os.path.join(root, prefix), prefix, after)
+
+
+def find_orphans(names, kind):
+    """Имена из names, на которые никто не ссылается."""
+    if kind == ORIGINAL:
+        used = set(
+            Post.objects.filter(image__in=names)
+            .values_list('image', flat=True)
+        )
+        return [name for name in names if name not in used]
+    keys = {
+        add_prefix(ImageFile(name, default.storage).key): name
+        for name in names
+    }
+    used = set(
+        KVStore.objects.filter(key__in=keys).values_list('key', flat=True)
+    )
+    return [name for key, name in keys.items() if key not in used]
+
+
+def delete_orphan(name, kind, min_age=MIN_AGE):
+    """Удаляет файл, если он всё ещё ничей и старше min_age.
+
+    Между обходом и удалением файл могла переиспользовать новая
+    загрузка (ContentAddressedStorage.save): она обновляет дату файла
+    под той же блокировкой, под которой здесь всё проверяется заново.
+    Возвращает, удалён ли файл.
+    """
+    path = default.storage.path(name)
+    with locked_file(path) as exists:
+        if (
+            not exists
+            or os.stat(path).st_mtime > time.time() - min_age
+            or not find_orphans([name], kind)
+        ):
+            return False
+        if kind == ORIGINAL:
+            # Вместе с записью об исходнике sorl удаляет его миниатюры.
+            default.kvstore.delete(ImageFile(name, default.storage))
+        default.storage.delete(name)
+        if kind == THUMBNAIL and not find_orphans([name], kind):
+            # sorl успел записать ключ уже удалённой миниатюры: без
+            # записи он создаст её заново.
+            default.kvstore.delete(
+                ImageFile(name, default.storage), delete_thumbnails=False
+            )
+    return True
+
+
+def collect(after=None, batch_size=BATCH_SIZE, min_age=MIN_AGE):
+    """Обходит MEDIA_ROOT и отдаёт пачки осиротевших файлов.
+
+    Каждая пачка — (orphans, last_name, scanned), где orphans — пары
+    (name, kind), а last_name — курсор для продолжения обхода.
+    """
+    prefixes = get_prefixes()
+    deadline = time.time() - min_age
+    batch = {kind: [] for kind in prefixes.values()}
+    scanned = 0
+
+    def flush(last_name):
+        orphans = [
+            (name, kind)
+            for kind, names in batch.items() if names
+            for name in find_orphans(names, kind)
+        ]
+        for names in batch.values():
+            names.clear()
+        return orphans, last_name, scanned
+
+    last_name = after
+    for name, mtime in iter_files(settings.MEDIA_ROOT, prefixes, after):
+        last_name = name
+        scanned += 1
+        if mtime > deadline:
+            continue
+        batch[prefixes[name.split('/', 1)[0]]].append(name)
+        if scanned % batch_size == 0:
+            yield flush(last_name)
+    yield flush(last_name)
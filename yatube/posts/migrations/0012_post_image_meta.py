@@ -0,0 +1,60 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:54
+
+import base64
+import io
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+from PIL import Image, ImageOps
+
+
+def describe(image_file):
+    # Заглушка как в posts.thumbnails.describe, но без импорта кода
+    # приложения: он меняется, а миграция должна работать как прежде.
+    with Image.open(image_file) as image:
+        preview = ImageOps.fit(image.convert('RGB'), (16, 6))
+    color = '#{:02x}{:02x}{:02x}'.format(
+        *preview.resize((1, 1), Image.BOX).getpixel((0, 0))
+    )
+    buffer = io.BytesIO()
+    preview.save(buffer, 'JPEG', quality=50)
+    placeholder = 'data:image/jpeg;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+    return color, placeholder
+
+
+def fill_image_meta(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    images = Post.objects.exclude(image='').values_list('pk', 'image')
+    for pk, name in images.iterator():
+        try:
+            with default_storage.open(name) as image_file:
+                color, placeholder = describe(image_file)
+        except (OSError, ValueError):
+            continue
+        Post.objects.filter(pk=pk).update(
+            image_color=color,
+            image_placeholder=placeholder,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_color',
+            field=models.CharField(blank=True, editable=False, max_length=7, verbose_name='Основной цвет изображения'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_placeholder',
+            field=models.TextField(blank=True, editable=False, verbose_name='Размытое превью изображения'),
+        ),
+        migrations.RunPython(fill_image_meta, migrations.RunPython.noop),
+    ]
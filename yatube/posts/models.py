@@ -1,9 +1,30 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа одним запросом, без лишних полей."""
+        return self.select_related('author', 'group').only(
+            'text',
+            'pub_date',
+            'updated_at',
+            'image',
+            'image_color',
+            'image_placeholder',
+            'author__username',
+            'author__first_name',
+            'author__last_name',
+            'group__title',
+            'group__slug',
+            'comments_count',
+        )
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста',
@@ -14,6 +35,10 @@ class Post(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -32,15 +57,62 @@ class Post(models.Model):
     image = models.ImageField(
         'Изображение',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    image_color = models.CharField(
+        'Основной цвет изображения',
+        max_length=7,
+        blank=True,
+        editable=False
+    )
+    image_placeholder = models.TextField(
+        'Размытое превью изображения',
+        blank=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['group', 'pub_date'], name='post_group_date_idx'
+            ),
+            models.Index(
+                fields=['author', 'pub_date'], name='post_author_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        # Счётчик комментариев сдвигают только update() из
+        # posts.counters: полное сохранение записало бы значение,
+        # прочитанное до новых комментариев.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'comments_count'
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def version(self):
+        """Версия карточки поста для ключа кэша.
+
+        updated_at меняется и при сдвиге счётчика комментариев: его
+        обновления через update() выставляют дату явно.
+        """
+        return f'{self.updated_at.timestamp():.6f}'
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
@@ -78,6 +150,11 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['post', 'pub_date'], name='comment_post_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text
@@ -103,3 +180,113 @@ class Follow(models.Model):
                 fields=['user', 'author'], name='unique_subscriptions'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'
+            ),
+        ]
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок: копия поста для каждого читателя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField('Дата публикации поста')
+
+    class Meta:
+        ordering = ['-pub_date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_post'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date'], name='timeline_user_date_asc_idx'
+            )
+        ]
+
+
+class UserStatsManager(models.Manager):
+    def for_user(self, user):
+        """Счётчики пользователя; при отсутствии строки считает их заново.
+
+        Чтобы не делать лишний запрос, загружайте user со
+        select_related('stats').
+        """
+        try:
+            return user.stats
+        except self.model.DoesNotExist:
+            stats, _ = self.get_or_create(
+                user=user, defaults=self.model.count_for(user.pk)
+            )
+            return stats
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики постов и подписок пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField('Количество постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField(
+        'Количество подписок',
+        default=0
+    )
+
+    objects = UserStatsManager()
+
+    @staticmethod
+    def count_for(user_id):
+        return {
+            'posts_count': Post.objects.filter(author_id=user_id).count(),
+            'followers_count': Follow.objects.filter(
+                author_id=user_id
+            ).count(),
+            'following_count': Follow.objects.filter(
+                user_id=user_id
+            ).count(),
+        }
+
+
+class ImportCheckpoint(models.Model):
+    """Позиция импорта (posts.importer): пишется в транзакции пачки."""
+    source = models.CharField('Импорт', max_length=255, unique=True)
+    line = models.PositiveIntegerField('Последняя записанная строка')
+
+
+class ImportedPost(models.Model):
+    """Соответствие id поста в файле импорта и id в базе."""
+    source = models.CharField('Импорт', max_length=255)
+    external_id = models.CharField('id в файле', max_length=255)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Пост'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source', 'external_id'], name='unique_imported_post'
+            )
+        ]
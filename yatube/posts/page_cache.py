@@ -0,0 +1,82 @@
+import hashlib
+import time
+import zlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .utils import feed_version_key, get_versions
+
+PAGE_CACHE_TIMEOUT: int = 60 * 60
+
+
+def page_cache_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'posts:page:{path}'
+
+
+def is_cacheable(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not len(get_messages(request))
+    )
+
+
+def get_cached_page(key):
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    versions = cache.get_many(entry['versions'])
+    if versions != entry['versions']:
+        return None
+    response = HttpResponse(
+        zlib.decompress(entry['body']),
+        content_type=entry['content_type'],
+        status=entry['status'],
+    )
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def store_page(key, response, started):
+    keys = [feed_version_key('all')]
+    keys += getattr(response, 'surrogate_keys', [])
+    versions = get_versions(keys)
+    if any(version > started for version in versions.values()):
+        # Версия выдана уже во время рендера: содержимое могло
+        # измениться, сохраним страницу при следующем запросе.
+        return
+    cache.set(key, {
+        'body': zlib.compress(response.content),
+        'content_type': response['Content-Type'],
+        'status': response.status_code,
+        'versions': versions,
+    }, getattr(settings, 'POSTS_PAGE_CACHE_TIMEOUT', PAGE_CACHE_TIMEOUT))
+
+
+def cache_anonymous_page(view):
+    """Кэширует страницы для анонимных посетителей целиком.
+
+    View помечает ответ ключами response.surrogate_keys (ключи версий
+    из feed_version_key). Запись сбрасывается, как только сигналы
+    выдают любому из её ключей новую версию.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_cacheable(request):
+            return view(request, *args, **kwargs)
+        key = page_cache_key(request)
+        response = get_cached_page(key)
+        if response is not None:
+            return response
+        started = time.time_ns()
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.cookies:
+            store_page(key, response, started)
+            response['X-Page-Cache'] = 'miss'
+        return response
+    return wrapper
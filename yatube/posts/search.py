@@ -0,0 +1,144 @@
+import base64
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+FTS_TABLE: str = 'posts_post_fts'
+SEARCH_PAGE_SIZE: int = 10
+SNIPPET_TOKENS: int = 32
+BATCH_SIZE: int = 1000
+
+# Маркеры подсветки не встречаются в тексте постов: после
+# экранирования HTML их заменяют на теги <mark>.
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match(query):
+    """Превращает ввод пользователя в запрос FTS5: все слова обязательны.
+
+    Каждое слово берётся в кавычки, поэтому синтаксис FTS5 во вводе
+    не интерпретируется.
+    """
+    terms = query.split()
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def _insert(cursor, rows):
+    cursor.executemany(
+        f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)', rows
+    )
+
+
+def index_post(post):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        _insert(cursor, [(post.pk, post.text)])
+
+
+def index_new_posts(rows):
+    """Добавляет в индекс посты, которых в нём ещё нет: пары (id, text)."""
+    if not is_available() or not rows:
+        return
+    with connection.cursor() as cursor:
+        _insert(cursor, rows)
+
+
+def unindex_post(post_id):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild(posts, batch_size=BATCH_SIZE):
+    """Заполняет индекс заново по queryset постов, возвращает их число."""
+    count = 0
+    rows = posts.order_by().values_list('pk', 'text')
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) == batch_size:
+                _insert(cursor, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            _insert(cursor, batch)
+            count += len(batch)
+    return count
+
+
+def filter_posts(queryset, query):
+    """Оставляет в queryset только посты, найденные по запросу."""
+    match = build_match(query)
+    if not match:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [match]
+    ))
+
+
+def encode_search_cursor(rank, post_id):
+    raw = f'{rank!r}|{post_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        rank, post_id = base64.urlsafe_b64decode(
+            padded.encode()
+        ).decode().split('|')
+        return float(rank), int(post_id)
+    except (ValueError, UnicodeError, TypeError):
+        return None
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def search(query, after=None, page_size=SEARCH_PAGE_SIZE):
+    """Порция результатов поиска после курсора after.
+
+    Возвращает список пар (post_id, подсвеченный фрагмент) и курсор
+    следующей порции или None.
+    """
+    match = build_match(query)
+    if not match or not is_available():
+        return [], None
+    sql = (
+        f'SELECT rowid, rank, snippet({FTS_TABLE}, 0, %s, %s, %s, %s) '
+        f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+    )
+    params = [MARK_START, MARK_END, '…', SNIPPET_TOKENS, match]
+    key = decode_search_cursor(after) if after else None
+    if key is not None:
+        sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+        params += [key[0], key[0], key[1]]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    params.append(page_size + 1)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_search_cursor(rows[-1][1], rows[-1][0])
+    return [(post_id, highlight(text)) for post_id, _, text in rows], \
+        next_cursor
@@ -0,0 +1,292 @@
+import logging
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import conditional, search, thumbnails, timeline
+from .counters import shift_comments_count, shift_user_stats
+from .follow_feed import get_engine, refresh_recent_posts
+from .models import Comment, Follow, Group, Post, User
+from .utils import bump_feed_versions, feed_count_key, feed_version_key
+
+logger = logging.getLogger(__name__)
+
+# Префикс ключа conditional.cached_lookup и поле, по которому ищут.
+LOOKUPS = {Group: ('group', 'slug'), User: ('user', 'username')}
+# Поля пользователя, которые выводятся в карточках постов.
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def post_count_keys(post, group_id=None):
+    keys = [
+        feed_count_key('index'),
+        feed_count_key('author', post.author_id),
+    ]
+    if group_id is not None:
+        keys.append(feed_count_key('group', group_id))
+    return keys
+
+
+def shift_counts(keys, delta):
+    """Сдвигает закэшированные счётчики, не пересчитывая их."""
+    for key in keys:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            # Счётчика нет в кэше — его посчитают при следующем запросе.
+            pass
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_group(sender, instance, **kwargs):
+    instance._old_group_id = None
+    if instance.pk is not None:
+        instance._old_group_id = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', flat=True)
+            .first()
+        )
+
+
+@receiver(pre_save, sender=Post)
+def describe_image(sender, instance, raw=False, **kwargs):
+    """Запоминает цвет и превью только что загруженной картинки."""
+    if raw:
+        return
+    if not instance.image:
+        instance.image_color = instance.image_placeholder = ''
+        return
+    if instance.image._committed:
+        return
+    try:
+        instance.image_color, instance.image_placeholder = (
+            thumbnails.describe(instance.image)
+        )
+    except (OSError, ValueError):
+        logger.exception('Не удалось разобрать картинку %s',
+                         instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def update_counts_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        shift_counts(post_count_keys(instance, instance.group_id), 1)
+        return
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if old_group_id != instance.group_id:
+        if old_group_id is not None:
+            shift_counts([feed_count_key('group', old_group_id)], -1)
+        if instance.group_id is not None:
+            shift_counts([feed_count_key('group', instance.group_id)], 1)
+
+
+@receiver(post_delete, sender=Post)
+def update_counts_on_delete(sender, instance, **kwargs):
+    shift_counts(post_count_keys(instance, instance.group_id), -1)
+
+
+@receiver(post_save, sender=Post)
+def update_follow_feeds_on_save(sender, instance, created, raw=False,
+                                **kwargs):
+    if raw:
+        return
+    engine = get_engine()
+    if engine == 'pull':
+        refresh_recent_posts(instance.author_id)
+    elif created and engine == 'timeline':
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def update_follow_feeds_on_delete(sender, instance, **kwargs):
+    if get_engine() == 'pull':
+        refresh_recent_posts(instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and get_engine() == 'timeline':
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    if get_engine() == 'timeline':
+        timeline.trim(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def count_created_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        shift_user_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    shift_user_stats(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_created_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        shift_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    shift_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_created_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        shift_user_stats(instance.author_id, followers_count=1)
+        shift_user_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    shift_user_stats(instance.author_id, followers_count=-1)
+    shift_user_stats(instance.user_id, following_count=-1)
+
+
+def post_version_keys(post, old_group_id=None):
+    keys = [
+        feed_version_key('index'),
+        feed_version_key('author', post.author_id),
+        feed_version_key('post', post.pk),
+    ]
+    for group_id in {post.group_id, old_group_id} - {None}:
+        keys.append(feed_version_key('group', group_id))
+    return keys
+
+
+@receiver(post_save, sender=Post)
+def bump_versions_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_feed_versions(post_version_keys(
+            instance, getattr(instance, '_old_group_id', None)
+        ))
+
+
+@receiver(post_delete, sender=Post)
+def bump_versions_on_delete(sender, instance, **kwargs):
+    bump_feed_versions(post_version_keys(instance))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_versions_on_comment(sender, instance, raw=False, **kwargs):
+    # В карточке поста выводится число комментариев.
+    if raw or instance.post_id is None:
+        return
+    post = Post.objects.filter(pk=instance.post_id).only(
+        'author_id', 'group_id'
+    ).first()
+    if post is not None:
+        bump_feed_versions(post_version_keys(post))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_versions_on_group(sender, instance, raw=False, **kwargs):
+    # Ссылки на группу есть в карточках всех лент.
+    if not raw:
+        bump_feed_versions([feed_version_key('all')])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_versions_on_follow(sender, instance, raw=False, **kwargs):
+    # В профилях выводятся счётчики подписчиков и подписок.
+    if not raw:
+        bump_feed_versions([
+            feed_version_key('author', instance.author_id),
+            feed_version_key('author', instance.user_id),
+        ])
+
+
+@receiver(pre_save, sender=Group)
+def forget_renamed_lookup(sender, instance, raw=False, **kwargs):
+    prefix, field = LOOKUPS[sender]
+    if raw or instance.pk is None:
+        return
+    old = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list(field, flat=True)
+        .first()
+    )
+    if old is not None and old != getattr(instance, field):
+        conditional.forget_lookups([f'{prefix}:{old}'])
+
+
+@receiver(pre_save, sender=User)
+def remember_old_names(sender, instance, update_fields=None, raw=False,
+                       **kwargs):
+    instance._old_names = None
+    if raw or instance.pk is None:
+        return
+    # Вход пользователя сохраняет только last_login.
+    if update_fields is not None and not set(AUTHOR_FIELDS) & set(
+        update_fields
+    ):
+        return
+    instance._old_names = (
+        User.objects.filter(pk=instance.pk)
+        .values_list(*AUTHOR_FIELDS)
+        .first()
+    )
+
+
+@receiver(post_save, sender=User)
+def bump_versions_on_rename(sender, instance, raw=False, **kwargs):
+    old_names = getattr(instance, '_old_names', None)
+    if raw or old_names is None:
+        return
+    if old_names == tuple(getattr(instance, f) for f in AUTHOR_FIELDS):
+        return
+    if old_names[0] != instance.username:
+        conditional.forget_lookups([f'user:{old_names[0]}'])
+    # Имя и ссылка на профиль автора есть в карточках всех лент, а
+    # фрагменты, кэш страниц и ETag строятся по версиям лент.
+    bump_feed_versions([
+        feed_version_key('all'),
+        feed_version_key('author', instance.pk),
+    ])
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=User)
+def forget_deleted_lookup(sender, instance, **kwargs):
+    prefix, field = LOOKUPS[sender]
+    conditional.forget_lookups([f'{prefix}:{getattr(instance, field)}'])
+
+
+@receiver(post_delete, sender=Post)
+def forget_deleted_post_lookup(sender, instance, **kwargs):
+    # Удалённый последний пост может уступить свой id новому.
+    conditional.forget_lookups([f'post:{instance.pk}'])
+
+
+@receiver(post_save, sender=Post)
+def update_search_index_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def update_search_index_on_delete(sender, instance, **kwargs):
+    search.unindex_post(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def schedule_thumbnails(sender, instance, raw=False, **kwargs):
+    # Миниатюры создаются после коммита, вне обработки запроса.
+    if raw or not instance.image:
+        return
+    image_name = instance.image.name
+    transaction.on_commit(lambda: thumbnails.schedule(image_name))
@@ -0,0 +1,85 @@
+import contextlib
+import fcntl
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# posts/ab/cd/abcd….jpg — 64 шестнадцатеричных знака sha256.
+HASHED_NAME = re.compile(
+    r'(^|/)([0-9a-f]{2})/([0-9a-f]{2})/\2\3[0-9a-f]{60}(\.|$)'
+)
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(name, digest):
+    """Имя файла по хэшу содержимого: каталог/ab/cd/<хэш>.<расширение>."""
+    directory, filename = posixpath.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return posixpath.join(
+        directory, digest[:2], digest[2:4], digest + extension
+    )
+
+
+def is_content_name(name):
+    return HASHED_NAME.search(name) is not None
+
+
+@contextlib.contextmanager
+def locked_file(path):
+    """Держит flock на файле; значение — существует ли файл ещё.
+
+    Под этой блокировкой загрузка переиспользует файл, а сборщик
+    мусора проверяет и удаляет его: одно не пересекается с другим.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        yield False
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            # Файл могли удалить, пока мы ждали блокировку.
+            exists = os.fstat(fd).st_ino == os.stat(path).st_ino
+        except FileNotFoundError:
+            exists = False
+        yield exists
+    finally:
+        os.close(fd)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файлы под именами из хэша содержимого.
+
+    Файлы раскладываются по вложенным каталогам по первым байтам хэша,
+    одинаковые загрузки сохраняются один раз.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_name(name, content_hash(content))
+        with locked_file(self.path(name)) as exists:
+            if exists:
+                # Файл снова нужен: по свежей дате сборщик мусора не
+                # удалит его, пока пост с ним не сохранён.
+                os.utime(self.path(name))
+                return name
+        # При гонке двух одинаковых загрузок вторая получит суффикс
+        # от get_available_name: лишняя копия, но не потеря данных.
+        return super().save(name, content, max_length)
@@ -0,0 +1,23 @@
+import logging
+
+from django import template
+
+from posts import cards, thumbnails
+
+logger = logging.getLogger(__name__)
+register = template.Library()
+
+
+@register.simple_tag
+def post_picture(post, css_class=cards.CARD_IMAGE_CLASS):
+    """<picture> с вариантами картинки поста, см. cards.render_picture."""
+    image = post.image
+    if not image:
+        return ''
+    try:
+        variants = thumbnails.get_variants(image.name)
+    except Exception:
+        # Как и {% thumbnail %}, не роняем страницу из-за картинки.
+        logger.exception('Не удалось получить миниатюры %s', image.name)
+        return ''
+    return cards.render_picture(post, variants, css_class)
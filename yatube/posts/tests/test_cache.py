@@ -0,0 +1,138 @@
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.test import SimpleTestCase, override_settings
+
+from core.cache import LocalLRU, TieredCache
+
+
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        caches['shared'].clear()
+
+    def make_worker(self, name, **options):
+        """Экземпляр кэша со своей памятью, как у отдельного процесса."""
+        options.setdefault('SHARED', 'shared')
+        return TieredCache(f'{self.id()}:{name}', {'OPTIONS': options})
+
+    def test_shared_between_workers(self):
+        """Значение, записанное одним процессом, видно другому."""
+        first, second = self.make_worker('first'), self.make_worker('second')
+        first.set('key', {'value': 1})
+        self.assertEqual(second.get('key'), {'value': 1})
+        self.assertEqual(second.get_many(['key', 'missing']),
+                         {'key': {'value': 1}})
+
+    def test_local_copy(self):
+        """Процесс отвечает из своей памяти, не спрашивая общий кэш."""
+        worker = self.make_worker('local')
+        worker.set('key', 'value')
+        caches['shared'].clear()
+        self.assertEqual(worker.get('key'), 'value')
+
+    def test_local_exclude(self):
+        """Ключи из LOCAL_EXCLUDE всегда читаются из общего кэша."""
+        worker = self.make_worker('exclude', LOCAL_EXCLUDE=('version:',))
+        worker.set('version:index', 1)
+        caches['shared'].clear()
+        self.assertIsNone(worker.get('version:index'))
+
+    def test_lru_bounded_by_bytes(self):
+        """LRU вытесняет давно не читанные значения по размеру."""
+        lru = LocalLRU(max_bytes=300)
+        lru.set('a', 'a' * 100, 60)
+        lru.set('b', 'b' * 100, 60)
+        lru.get('a')
+        lru.set('c', 'c' * 100, 60)
+        self.assertLessEqual(lru.size, 300)
+        self.assertIsNotNone(lru.get('a'))
+        self.assertIsNone(lru.get('b'))
+
+    def test_stale_while_revalidate(self):
+        """Истёкшее значение пересчитывает один процесс."""
+        first, second = self.make_worker('first'), self.make_worker('second')
+        caches['shared'].set(
+            first.make_key('key'), ('old', time.time() - 1), 60
+        )
+        self.assertIsNone(first.get('key'))
+        self.assertEqual(second.get('key'), 'old')
+        first.set('key', 'new')
+        self.assertEqual(second.get('key'), 'new')
+
+    def test_get_or_set_single_flight(self, shared='shared'):
+        """При промахе значение вычисляется один раз на все процессы."""
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        def request(number):
+            worker = self.make_worker(f'worker{number}', SHARED=shared)
+            results.append(worker.get_or_set('hot', compute, 60))
+
+        threads = [
+            threading.Thread(target=request, args=(number,))
+            for number in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 5)
+
+    def test_incr(self):
+        """incr меняет значение в общем кэше и в памяти процесса."""
+        first, second = self.make_worker('first'), self.make_worker('second')
+        first.set('count', 1)
+        self.assertEqual(second.incr('count'), 2)
+        self.assertEqual(second.get('count'), 2)
+        with self.assertRaises(ValueError):
+            first.incr('missing')
+
+    def test_file_locks(self):
+        """С файловым общим кэшем блокировка берётся flock, а не add().
+
+        add() файлового кэша неатомарен: гонку изображает has_key,
+        который всегда отвечает «ключа нет».
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        files = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory,
+        }
+        with override_settings(CACHES=dict(settings.CACHES, files=files)), \
+                mock.patch.object(FileBasedCache, 'has_key',
+                                  return_value=False):
+            self.test_get_or_set_single_flight(shared='files')
+            first = self.make_worker('first', SHARED='files')
+            second = self.make_worker('second', SHARED='files')
+            self.assertTrue(first._acquire('key'))
+            self.assertFalse(second._acquire('key'))
+            self.assertTrue(second.locks.is_locked('key'))
+            first.close()
+            self.assertFalse(second.locks.is_locked('key'))
+            self.assertTrue(second._acquire('key'))
+            second.close()
+
+    def test_close_releases_stale_lock(self):
+        """Блокировку читателя, не записавшего значение, снимает close()."""
+        first, second = self.make_worker('first'), self.make_worker('second')
+        caches['shared'].set(
+            first.make_key('key'), ('old', time.time() - 1), 60
+        )
+        self.assertIsNone(first.get('key'))
+        self.assertEqual(second.get('key'), 'old')
+        first.close()
+        self.assertIsNone(second.get('key'))
@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings
+)
+from django.urls import reverse
+
+from core.db import copy_database, pragma_statements
+from core.routers import WRITE_COOKIE, mark_synced, use_replica
+from posts.conditional import read_from_replica
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+class SQLitePragmasTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        """Новое соединение получает PRAGMA из настроек."""
+        self.assertEqual(
+            self.pragma('busy_timeout'),
+            settings.SQLITE_PRAGMAS['busy_timeout']
+        )
+        self.assertEqual(
+            self.pragma('cache_size'), settings.SQLITE_PRAGMAS['cache_size']
+        )
+        # 1 — NORMAL.
+        self.assertEqual(self.pragma('synchronous'), 1)
+
+    def test_invalid_pragma(self):
+        """Значение не может дописать к PRAGMA другой запрос."""
+        with self.assertRaises(ImproperlyConfigured):
+            pragma_statements({'journal_mode': 'wal; DROP TABLE posts_post'})
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def read_alias(self, request, min_version=0):
+        with use_replica(request, min_version):
+            return router.db_for_read(Post)
+
+    def test_reads_from_synced_replica(self):
+        """Чтения идут на реплику, запись и всё после неё — на основную."""
+        mark_synced('replica', time.time_ns())
+        request = self.factory.get('/')
+        with use_replica(request):
+            self.assertEqual(router.db_for_read(Post), 'replica')
+            self.assertEqual(router.db_for_write(Post), 'default')
+            self.assertEqual(router.db_for_read(Post), 'default')
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_lagging_replica(self):
+        """Реплика, не догнавшая версию страницы, не используется."""
+        request = self.factory.get('/')
+        self.assertEqual(self.read_alias(request), 'default')
+        mark_synced('replica', time.time_ns())
+        self.assertEqual(self.read_alias(request), 'replica')
+        self.assertEqual(
+            self.read_alias(request, time.time_ns()), 'default'
+        )
+        with override_settings(DATABASE_REPLICA_MAX_LAG=0):
+            self.assertEqual(self.read_alias(request), 'default')
+
+    def test_read_from_replica_uses_page_versions(self):
+        """Страница читается с реплики, только если та новее её версий."""
+        view = read_from_replica(
+            lambda request: HttpResponse(router.db_for_read(Post))
+        )
+        synced = time.time_ns()
+        mark_synced('replica', synced)
+        request = self.factory.get('/')
+        request._page_versions = {'posts:version:all': synced - 1}
+        self.assertEqual(view(request).content, b'replica')
+        request._page_versions = {'posts:version:all': synced + 1}
+        self.assertEqual(view(request).content, b'default')
+
+    def test_pinned_after_write(self):
+        """После записи пользователь читает с реплики, получившей её."""
+        mark_synced('replica', time.time_ns())
+        author = User.objects.create_user(username='author')
+        post = Post.objects.create(author=author, text='Пост')
+        self.client.force_login(author)
+        response = self.client.post(
+            reverse('posts:add_comment', args=(post.pk,)), {'text': 'Ок'}
+        )
+        pin = response.cookies[WRITE_COOKIE]
+        self.assertEqual(pin['max-age'], settings.DATABASE_REPLICA_MAX_LAG)
+        request = self.factory.get('/')
+        request.COOKIES[WRITE_COOKIE] = pin.value
+        self.assertEqual(self.read_alias(request), 'default')
+        # И через 10 секунд реплика без этой записи не годится.
+        later = int(pin.value) + 10 * 10 ** 9
+        with mock.patch('time.time_ns', return_value=later):
+            self.assertEqual(self.read_alias(request), 'default')
+        mark_synced('replica', time.time_ns())
+        self.assertEqual(self.read_alias(request), 'replica')
+
+
+class ReplicationTest(TransactionTestCase):
+    # В TestCase открыта транзакция записи, и копирование её ждёт.
+    def test_copy_database(self):
+        """Копия основной базы содержит её данные."""
+        Group.objects.create(title='Группа', slug='replicated')
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        copy_database(connection, path)
+        replica = sqlite3.connect(path)
+        self.addCleanup(replica.close)
+        self.assertEqual(replica.execute(
+            'SELECT slug FROM posts_group'
+        ).fetchall(), [('replicated',)])
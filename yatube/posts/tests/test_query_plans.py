@@ -0,0 +1,104 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.follow_feed import TIMELINE_CURSOR_FIELDS, get_follow_feed
+from posts.models import Comment, Follow, Group, Post, User
+from posts.utils import CursorPaginator, encode_cursor
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+( AS \w+)?$')
+
+
+class QueryPlanTests(TestCase):
+    """Запросы страниц не читают таблицы целиком и не сортируют во
+    временных B-деревьях.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test_slug',
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='auth')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(15):
+            cls.post = Post.objects.create(
+                author=cls.author,
+                text=f'Тестовый текст {i}',
+                group=cls.group,
+            )
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text=f'Коммент {i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def get_urls(self):
+        return (
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:index') + f'?after={encode_cursor(self.post)}',
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse(
+                'posts:group_list', kwargs={'slug': self.group.slug}
+            ) + f'?after={encode_cursor(self.post)}',
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        )
+
+    def get_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_plans(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.authorized_client.get(url).status_code, 200)
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            for step in self.get_plan(sql):
+                with self.subTest(url=url, step=step, sql=sql):
+                    self.assertIsNone(FULL_SCAN.match(step))
+                    self.assertNotIn('TEMP B-TREE', step)
+
+    def test_views_use_indexes(self):
+        """Страницы лент, поста и комментариев читают индексы."""
+        for url in self.get_urls():
+            self.assert_plans(url)
+
+    def test_follow_engines_use_indexes(self):
+        """Движки ленты подписок читают индексы.
+
+        Движок join оставлен как эталон для сравнения: слияние постов
+        нескольких авторов через Follow всегда требует сортировки.
+        """
+        for engine in ('timeline', 'pull'):
+            with override_settings(POSTS_FOLLOW_FEED_ENGINE=engine):
+                cache.clear()
+                self.assert_plans(reverse('posts:follow_index'))
+
+    @override_settings(POSTS_FOLLOW_FEED_ENGINE='timeline')
+    def test_timeline_cursor_uses_index(self):
+        """Курсоры ленты timeline идут по индексу (user, pub_date)."""
+        cursor = CursorPaginator(
+            get_follow_feed(self.reader), 5, fields=TIMELINE_CURSOR_FIELDS
+        ).get_page().next_cursor
+        url = reverse('posts:follow_index')
+        for param in ('after', 'before'):
+            with self.subTest(param=param):
+                self.assert_plans(f'{url}?{param}={cursor}')
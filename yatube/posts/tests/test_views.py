@@ -1,15 +1,35 @@
+import json
+import os
 import shutil
 import tempfile
+import time
+from io import StringIO
+from unittest import mock
 
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django import forms
+from sorl.thumbnail import get_thumbnail
 
-
-from posts.models import Post, Group, User, Follow
+from posts import (
+    cards, conditional, dump, follow_feed, importer, media_gc, search,
+    thumbnails,
+)
+from posts.storage import is_content_name
+from posts.models import (
+    Comment, Follow, Group, ImportCheckpoint, ImportedPost, Post, Timeline,
+    User, UserStats
+)
+from posts.utils import (
+    CursorPage, FeedPaginator, encode_cursor, feed_count_key
+)
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -221,6 +241,172 @@ class PaginatorViewsTest(TestCase):
             )
 
 
+class FeedPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth_window')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test_slug_window',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_page_window(self):
+        """Навигация показывает первую, последнюю и соседние страницы."""
+        paginator = FeedPaginator(list(range(500)), 10)
+        self.assertEqual(
+            paginator.get_page(25).page_window,
+            [1, None, 23, 24, 25, 26, 27, None, 50]
+        )
+        self.assertEqual(
+            paginator.get_page(1).page_window, [1, 2, 3, None, 50]
+        )
+        self.assertEqual(FeedPaginator([1], 10).get_page(1).page_window, [1])
+
+    def test_count_cache_follows_create_and_delete(self):
+        """Счётчик ленты обновляется при создании и удалении поста."""
+        key = feed_count_key('group', self.group.pk)
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.guest_client.get(url)
+        self.assertEqual(cache.get(key), 0)
+        post = Post.objects.create(
+            author=self.author, text='Тестовый текст', group=self.group
+        )
+        self.assertEqual(cache.get(key), 1)
+        post.group = None
+        post.save()
+        self.assertEqual(cache.get(key), 0)
+        post.group = self.group
+        post.save()
+        self.assertEqual(cache.get(key), 1)
+        post.delete()
+        self.assertEqual(cache.get(key), 0)
+        self.assertEqual(
+            self.guest_client.get(url).context['page_obj'].paginator.count, 0
+        )
+
+
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth_cursor')
+        for i in range(15):
+            Post.objects.create(
+                author=cls.author,
+                text=f'Тестовый текст {i}',
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_cursor_pages(self):
+        """Курсоры after/before листают ленту без пропусков и повторов."""
+        url = reverse('posts:index')
+        first = self.guest_client.get(url).context['page_obj']
+        after = encode_cursor(first[len(first) - 1])
+        second = self.guest_client.get(
+            url, {'after': after}
+        ).context['page_obj']
+        self.assertEqual(len(second), 5)
+        self.assertFalse(second.has_next())
+        self.assertEqual(
+            [post.pk for post in list(first) + list(second)],
+            list(Post.objects.order_by('-pub_date', '-pk')
+                 .values_list('pk', flat=True))
+        )
+        back = self.guest_client.get(
+            url, {'before': second.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+
+    def test_cursor_stable_on_new_post(self):
+        """Новый пост не сдвигает следующую страницу курсора."""
+        url = reverse('posts:index')
+        first = self.guest_client.get(url).context['page_obj']
+        after = encode_cursor(first[len(first) - 1])
+        expected = list(
+            self.guest_client.get(url, {'after': after}).context['page_obj']
+        )
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = self.guest_client.get(url, {'after': after})
+        self.assertEqual(list(response.context['page_obj']), expected)
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый курсор открывает первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:index'), {'after': 'broken'}
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+    @override_settings(POSTS_PAGINATION_MODE='cursor')
+    def test_page_links_in_cursor_mode(self):
+        """В режиме курсоров старые ссылки ?page=N продолжают работать."""
+        url = reverse('posts:index')
+        self.assertIsInstance(
+            self.guest_client.get(url).context['page_obj'], CursorPage
+        )
+        response = self.guest_client.get(url, {'page': 2})
+        self.assertEqual(response.context['page_obj'].number, 2)
+        self.assertEqual(len(response.context['page_obj']), 5)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test_slug_queries',
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        for i in range(12):
+            author = User.objects.create_user(username=f'author_{i}')
+            Follow.objects.create(user=cls.reader, author=author)
+            post = Post.objects.create(
+                author=author,
+                text=f'Тестовый текст {i}',
+                group=cls.group,
+            )
+            Comment.objects.create(post=post, author=author, text='Коммент')
+        cls.author = author
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_feed_query_count(self):
+        """Число запросов ленты не зависит от количества постов."""
+        # Группе и профилю с холодным кэшем нужен ещё запрос: id для
+        # ETag (conditional.cached_lookup) ищется до самой страницы.
+        feeds = (
+            (self.guest_client, reverse('posts:index'), 2),
+            (self.guest_client, reverse(
+                'posts:group_list', kwargs={'slug': self.group.slug}
+            ), 4),
+            (self.guest_client, reverse(
+                'posts:profile', kwargs={'username': self.author.username}
+            ), 4),
+            (self.authorized_client, reverse('posts:follow_index'), 4),
+        )
+        for client, url, num_queries in feeds:
+            with self.subTest(url=url):
+                with self.assertNumQueries(num_queries):
+                    response = client.get(url)
+                self.assertEqual(
+                    response.context['page_obj'][0].comments_count, 1
+                )
+
+
 class CasheViewsTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -250,16 +436,36 @@ class CasheViewsTest(TestCase):
             reverse('posts:index')
         ).content
         new_post.delete()
-        response_cache = self.authorized_client.get(
-            reverse('posts:index')
-        ).content
-        self.assertEqual(response, response_cache)
-        cache.clear()
         response_not_cache = self.authorized_client.get(
             reverse('posts:index')
         ).content
         self.assertNotEqual(response, response_not_cache)
 
+    def test_cache_feeds_until_post_changes(self):
+        """Фрагменты лент живут в кэше, пока не изменится пост или группа."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                Post.objects.filter(pk=self.post.pk).update(text='Тестовый')
+                self.guest_client.get(url)
+                Post.objects.filter(pk=self.post.pk).update(text='Без сигнала')
+                self.assertNotContains(self.guest_client.get(url), 'сигнала')
+                self.post.text = 'Отредактирован'
+                self.post.save()
+                self.assertContains(
+                    self.guest_client.get(url), 'Отредактирован'
+                )
+        self.group.slug = 'new_slug'
+        self.group.save()
+        self.assertContains(
+            self.guest_client.get(reverse('posts:index')), '/group/new_slug/'
+        )
+
 
 class FollowTest(TestCase):
     @classmethod
@@ -328,3 +534,1206 @@ class FollowTest(TestCase):
         """Новый пост НЕ появляется в ленте у НЕ подписчика."""
         response = self.authorized_client.post(reverse('posts:follow_index'))
         self.assertFalse(self.post in response.context['page_obj'].object_list)
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_timeline')
+        cls.user = User.objects.create_user(username='reader_timeline')
+        cls.old_post = Post.objects.create(
+            author=cls.author,
+            text='Старый пост',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def get_feed(self):
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_timeline_follow_and_post(self):
+        """Подписка дозаполняет ленту, новый пост раскладывается в неё."""
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}
+        ))
+        self.assertEqual(self.get_feed(), [self.old_post])
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertTrue(
+            Timeline.objects.filter(user=self.user, post=new_post).exists()
+        )
+        self.assertEqual(self.get_feed(), [new_post, self.old_post])
+
+    def test_timeline_unfollow(self):
+        """После отписки посты автора пропадают из ленты."""
+        Follow.objects.create(user=self.user, author=self.author)
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.author}
+        ))
+        self.assertFalse(Timeline.objects.filter(user=self.user).exists())
+        self.assertEqual(self.get_feed(), [])
+
+    def test_rebuild_timelines_command(self):
+        """Команда rebuild_timelines восстанавливает ленты с нуля."""
+        Follow.objects.create(user=self.user, author=self.author)
+        Timeline.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.get_feed(), [self.old_post])
+
+
+class FollowFeedEnginesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader_engines')
+        cls.stranger = User.objects.create_user(username='stranger_engines')
+        cls.authors = [
+            User.objects.create_user(username=f'author_engines_{i}')
+            for i in range(3)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.user, author=author)
+        for i in range(12):
+            Post.objects.create(author=cls.authors[i % 3], text=f'Пост {i}')
+            Post.objects.create(author=cls.stranger, text=f'Чужой {i}')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def get_feed(self, page=1):
+        response = self.authorized_client.get(
+            reverse('posts:follow_index'), {'page': page}
+        )
+        return list(response.context['page_obj'])
+
+    def test_engines_return_same_feed(self):
+        """Все движки ленты подписок отдают одинаковые страницы."""
+        expected = list(
+            Post.objects.filter(author__in=self.authors)
+            .order_by('-pub_date', '-pk')
+        )
+        for engine in ('join', 'timeline', 'pull'):
+            with self.subTest(engine=engine):
+                with self.settings(POSTS_FOLLOW_FEED_ENGINE=engine):
+                    self.assertEqual(
+                        self.get_feed(1) + self.get_feed(2), expected
+                    )
+
+    @override_settings(POSTS_PAGINATION_MODE='cursor')
+    def test_cursor_pages(self):
+        """Курсоры ленты подписок проходят её целиком в том же порядке."""
+        expected = list(
+            Post.objects.filter(author__in=self.authors)
+            .order_by('-pub_date', '-pk')
+        )
+        for engine in ('join', 'timeline'):
+            with self.subTest(engine=engine):
+                with self.settings(POSTS_FOLLOW_FEED_ENGINE=engine):
+                    posts, params = [], {}
+                    while params is not None:
+                        page_obj = self.authorized_client.get(
+                            reverse('posts:follow_index'), params
+                        ).context['page_obj']
+                        posts += list(page_obj)
+                        params = (
+                            {'after': page_obj.next_cursor}
+                            if page_obj.has_next() else None
+                        )
+                    self.assertEqual(posts, expected)
+
+    @override_settings(POSTS_FOLLOW_FEED_ENGINE='pull')
+    def test_pull_engine_sees_new_post(self):
+        """Кэш свежих постов автора обновляется при создании поста."""
+        self.get_feed()
+        post = Post.objects.create(author=self.authors[0], text='Новый')
+        self.assertEqual(self.get_feed()[0], post)
+
+    @override_settings(POSTS_FOLLOW_FEED_ENGINE='pull')
+    def test_pull_engine_caps_each_author(self):
+        """Ограничение глубины действует на каждого автора отдельно."""
+        with mock.patch.object(follow_feed, 'RECENT_POSTS_PER_AUTHOR', 2):
+            feed = follow_feed.get_follow_feed(self.user)
+        self.assertEqual(len(feed), 2 * len(self.authors))
+
+    def test_other_engines_skip_recent_posts(self):
+        """Без движка pull сохранение поста не пишет его кэш."""
+        for engine in ('join', 'timeline'):
+            with self.subTest(engine=engine):
+                with self.settings(POSTS_FOLLOW_FEED_ENGINE=engine):
+                    Post.objects.create(author=self.authors[0], text='Пост')
+                self.assertIsNone(cache.get(
+                    follow_feed.recent_posts_key(self.authors[0].pk)
+                ))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_counters')
+        cls.user = User.objects.create_user(username='reader_counters')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_counters_follow_writes(self):
+        """Счётчики обновляются при постах, комментариях и подписках."""
+        post = Post.objects.create(author=self.author, text='Тестовый текст')
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            {'text': 'Комментарий'}
+        )
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}
+        ))
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        author_stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.user).following_count, 1
+        )
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.author}
+        ))
+        Comment.objects.filter(post=post).delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 0
+        )
+        post.delete()
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 0
+        )
+
+    def test_edit_keeps_comments_count(self):
+        """Правка поста не затирает счётчик комментариев."""
+        post = Post.objects.create(author=self.author, text='Тестовый текст')
+        stale = Post.objects.get(pk=post.pk)
+        Comment.objects.create(post=post, author=self.user, text='Коммент')
+        stale.text = 'Новый текст'
+        stale.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Новый текст')
+        self.assertEqual(post.comments_count, 1)
+
+    def test_drifted_counter_not_negative(self):
+        """Удаление при разошедшемся нулевом счётчике не падает."""
+        post = Post.objects.create(author=self.author, text='Тестовый текст')
+        comment = Comment.objects.create(
+            post=post, author=self.user, text='Коммент'
+        )
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        UserStats.objects.filter(user=self.author).update(posts_count=0)
+        comment.delete()
+        post.delete()
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 0
+        )
+
+    def test_reconcile_counters_command(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        post = Post.objects.create(author=self.author, text='Тестовый текст')
+        Comment.objects.create(post=post, author=self.user, text='Коммент')
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.filter(pk=post.pk).update(comments_count=7)
+        UserStats.objects.filter(user=self.author).update(posts_count=5)
+        UserStats.objects.filter(user=self.user).delete()
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1
+        )
+        self.assertEqual(
+            UserStats.objects.get(user=self.user).following_count, 1
+        )
+
+
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_page_cache')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test_slug_page_cache',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Тестовый текст',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+
+    def warm_up(self, url):
+        self.guest_client.get(url)
+        self.guest_client.get(url)
+        self.assertEqual(self.guest_client.get(url)['X-Page-Cache'], 'hit')
+
+    def test_anonymous_pages_cached(self):
+        """Анонимные страницы отдаются из кэша без запросов к БД."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.warm_up(url)
+                with self.assertNumQueries(0):
+                    self.guest_client.get(url)
+
+    def test_authorized_pages_not_cached(self):
+        """Авторизованные пользователи кэш страниц не используют."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.warm_up(url)
+                response = self.authorized_client.get(url)
+                self.assertFalse(response.has_header('X-Page-Cache'))
+
+    def test_page_cache_purged_on_changes(self):
+        """Записи кэша сбрасываются при изменении поста и комментариях."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.warm_up(url)
+                self.post.text = f'Правка для {url}'
+                self.post.save()
+                self.assertContains(
+                    self.guest_client.get(url), f'Правка для {url}'
+                )
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.warm_up(url)
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Свежий комментарий'
+        )
+        self.assertContains(self.guest_client.get(url), 'Свежий комментарий')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_conditional')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test_slug_conditional',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Тестовый текст',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+
+    def test_not_modified(self):
+        """Неизменившаяся страница отвечает 304 по ETag и Last-Modified."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag']
+                )
+                self.assertEqual(response.status_code, 304)
+                response = self.guest_client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+                )
+                self.assertEqual(response.status_code, 304)
+
+    def test_modified_after_post_change(self):
+        """После правки поста валидатор меняется."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.guest_client.get(url)['ETag']
+                self.post.save()
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_lookups_forgotten(self):
+        """Переименование и удаление сбрасывают закэшированные id."""
+        for url in self.urls:
+            self.guest_client.get(url)
+        keys = [
+            conditional.lookup_key(f'group:{self.group.slug}'),
+            conditional.lookup_key(f'user:{self.author.username}'),
+            conditional.lookup_key(f'post:{self.post.pk}'),
+        ]
+        self.assertEqual(len(cache.get_many(keys)), 3)
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'renamed_slug_conditional'
+        group.save()
+        Post.objects.get(pk=self.post.pk).delete()
+        User.objects.get(pk=self.author.pk).delete()
+        self.assertEqual(cache.get_many(keys), {})
+
+    def test_rename_changes_pages(self):
+        """Переименование автора меняет ленты, профиль и их ETag."""
+        urls = self.urls[:3]
+        etags = {url: self.guest_client.get(url)['ETag'] for url in urls}
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Переименованный'
+        author.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Переименованный')
+                self.assertEqual(self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag']
+                ).status_code, 304)
+
+    def test_etag_depends_on_user(self):
+        """Анонимный ETag не подходит авторизованному пользователю."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.guest_client.get(url)['ETag']
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header('Last-Modified'))
+
+
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_comments')
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Тестовый текст',
+        )
+        for i in range(25):
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'Комментарий {i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_post_detail_first_comments(self):
+        """Первая порция комментариев грузится постоянным числом запросов."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.guest_client.get(url)
+        cache.clear()
+        with self.assertNumQueries(3):
+            response = self.guest_client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertTrue(comments.has_next())
+        self.assertEqual(comments[0].text, 'Комментарий 24')
+
+    def test_comments_fragment(self):
+        """Фрагмент отдаёт следующую порцию комментариев."""
+        first = self.guest_client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )).context['comments']
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'after': first.next_cursor}
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comment_list.html')
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            [f'Комментарий {i}' for i in range(4, -1, -1)]
+        )
+        self.assertFalse(response.context['comments'].has_next())
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_search')
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Кошки любят <b>рыбу</b> и спят на солнце',
+        )
+        for i in range(12):
+            Post.objects.create(author=cls.author, text=f'Собака номер {i}')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query, **params):
+        return self.guest_client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+
+    def test_search_highlights_and_escapes(self):
+        """Совпадения подсвечены, HTML из текста поста экранирован."""
+        response = self.search('рыбу')
+        self.assertEqual(
+            [post for post, _ in response.context['results']], [self.post]
+        )
+        self.assertContains(response, '<mark>рыбу</mark>')
+        self.assertNotContains(response, '<b>')
+
+    def test_search_keyset_pagination(self):
+        """Результаты отдаются порциями по курсору after."""
+        first = self.search('собака')
+        self.assertEqual(len(first.context['results']), 10)
+        second = self.search('собака', after=first.context['next_cursor'])
+        self.assertEqual(len(second.context['results']), 2)
+        self.assertIsNone(second.context['next_cursor'])
+        seen = {post.pk for post, _ in first.context['results']}
+        self.assertFalse(
+            seen & {post.pk for post, _ in second.context['results']}
+        )
+
+    def test_search_syntax_is_not_interpreted(self):
+        """Синтаксис FTS5 во вводе не ломает поиск."""
+        response = self.search('"рыбу OR NEAR(')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['results'], [])
+
+    def test_index_follows_post_changes(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = Post.objects.create(author=self.author, text='Старый текст')
+        post.text = 'Новый текст'
+        post.save()
+        self.assertFalse(self.search('старый').context['results'])
+        self.assertEqual(
+            [found for found, _ in self.search('новый').context['results']],
+            [post]
+        )
+        post.delete()
+        self.assertFalse(self.search('новый').context['results'])
+
+    def test_rebuild_search_index(self):
+        """Команда пересобирает индекс по таблице постов."""
+        out = StringIO()
+        call_command('rebuild_search_index', batch_size=5, stdout=out)
+        self.assertIn('13', out.getvalue())
+        self.assertEqual(len(self.search('солнце').context['results']), 1)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по полнотекстовому индексу."""
+        admin = User.objects.create_superuser(
+            username='admin_search', email='admin@example.com',
+            password='password'
+        )
+        client = Client()
+        client.force_login(admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'солнце'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.post]
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POSTS_THUMBNAIL_WORKERS=0)
+class PostImagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_thumbs')
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Тестовый текст',
+            image=SimpleUploadedFile(
+                name='thumb.gif',
+                content=(
+                    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+                    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+                    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+                    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+                    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+                    b'\x0A\x00\x3B'
+                ),
+                content_type='image/gif'
+            )
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def regenerate(self):
+        out = StringIO()
+        call_command('regenerate_thumbnails', workers=1, stdout=out)
+        return out.getvalue()
+
+    def test_regenerate_shared_image_once(self):
+        """Картинка нескольких постов обрабатывается один раз."""
+        Post.objects.create(
+            author=self.post.author, text='Та же картинка',
+            image=self.post.image.name,
+        )
+        with mock.patch.object(
+            thumbnails, 'regenerate', return_value=0
+        ) as regenerate:
+            self.regenerate()
+        regenerate.assert_called_once_with(self.post.image.name)
+
+    def test_page_uses_pregenerated_thumbnails(self):
+        """Страница поста выводит заранее созданные варианты картинки."""
+        thumbnails.schedule(self.post.image.name)
+        names = thumbnails.generate(self.post.image.name)
+        self.assertEqual(len(names), 4)
+        response = Client().get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        ))
+        for name in names:
+            self.assertContains(response, settings.MEDIA_URL + name)
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_thumbnail_name_matches_sorl(self):
+        """thumbnail_name совпадает с именем от get_thumbnail."""
+        name = self.post.image.name
+        for extra in ({}, {'THUMBNAIL_PROGRESSIVE': False}):
+            with self.settings(**extra):
+                for geometry, options in thumbnails.get_specs():
+                    with self.subTest(geometry=geometry, **options, **extra):
+                        self.assertEqual(
+                            thumbnails.thumbnail_name(
+                                name, geometry, options
+                            ),
+                            get_thumbnail(name, geometry, **options).name,
+                        )
+
+    def test_page_variants_batched(self):
+        """Миниатюры страницы читаются из kvstore одним запросом."""
+        name = self.post.image.name
+        expected = {
+            image_format: [(width, thumbnail.name)
+                           for width, thumbnail in variants]
+            for image_format, variants in
+            thumbnails.get_variants(name).items()
+        }
+        cache.clear()
+        with self.assertNumQueries(1):
+            variants = thumbnails.get_many_variants([name])
+        with self.assertNumQueries(0):
+            thumbnails.get_many_variants([name])
+        self.assertEqual({
+            image_format: [(width, thumbnail.name)
+                           for width, thumbnail in found]
+            for image_format, found in variants[name].items()
+        }, expected)
+        response = Client().get(reverse('posts:index'))
+        self.assertContains(response, '<source type="image/webp"')
+
+    def test_regenerate_missing_thumbnails(self):
+        """Команда создаёт только отсутствующие миниатюры."""
+        self.assertIn('миниатюр создано: 4', self.regenerate())
+        self.assertIn('миниатюр создано: 0', self.regenerate())
+        name = thumbnails.generate(self.post.image.name)[0]
+        os.remove(os.path.join(TEMP_MEDIA_ROOT, name))
+        self.assertIn('миниатюр создано: 1', self.regenerate())
+        self.assertTrue(os.path.exists(os.path.join(TEMP_MEDIA_ROOT, name)))
+
+    def test_image_meta_saved_on_upload(self):
+        """Цвет и превью картинки сохраняются при загрузке."""
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertRegex(post.image_color, r'^#[0-9a-f]{6}$')
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,')
+        )
+        response = Client().get(reverse(
+            'posts:post_detail', kwargs={'post_id': post.pk}
+        ))
+        self.assertContains(response, post.image_placeholder)
+        post.image = None
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.image_color, '')
+        self.assertEqual(post.image_placeholder, '')
+
+    def test_identical_uploads_stored_once(self):
+        """Одинаковые загрузки хранятся одним файлом с именем по хэшу.
+
+        Повторная загрузка обновляет дату файла для сборщика мусора.
+        """
+        path = default_storage.path(self.post.image.name)
+        os.utime(path, (0, 0))
+        post = Post.objects.create(
+            author=self.author,
+            text='Копия',
+            image=SimpleUploadedFile(
+                name='copy.GIF',
+                content=Post.objects.get(pk=self.post.pk).image.read(),
+                content_type='image/gif'
+            )
+        )
+        self.assertEqual(post.image.name, self.post.image.name)
+        self.assertRegex(
+            post.image.name,
+            r'^posts/([0-9a-f]{2})/([0-9a-f]{2})/\1\2\w+\.gif$'
+        )
+        self.assertGreater(os.stat(path).st_mtime, time.time() - 60)
+
+    def test_migrate_media_storage(self):
+        """Команда переносит старые файлы и переписывает пути постов."""
+        legacy_name = default_storage.save(
+            'posts/legacy.gif', ContentFile(b'legacy')
+        )
+        Post.objects.filter(pk=self.post.pk).update(image=legacy_name)
+        out = StringIO()
+        call_command('migrate_media_storage', batch_size=1, stdout=out)
+        self.assertIn('Файлов перенесено: 1', out.getvalue())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertTrue(is_content_name(post.image.name))
+        self.assertTrue(default_storage.exists(post.image.name))
+        self.assertFalse(default_storage.exists(legacy_name))
+
+    def test_collect_media_garbage(self):
+        """Сборщик удаляет только файлы, на которые никто не ссылается."""
+        old_post = Post.objects.create(
+            author=self.author,
+            text='Старая картинка',
+            image=SimpleUploadedFile(
+                name='old.gif',
+                content=b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00'
+                        b'\xff\xff\xff!\xf9\x04\x00\x00\x00\x00\x00,\x00\x00'
+                        b'\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;',
+                content_type='image/gif'
+            )
+        )
+        old_name = old_post.image.name
+        old_thumbnails = thumbnails.generate(old_name)
+        kept_thumbnails = thumbnails.generate(self.post.image.name)
+        stray = default_storage.save('cache/00/00/stray.jpg', ContentFile(b''))
+        old_post.image = None
+        old_post.save()
+
+        out = StringIO()
+        call_command(
+            'collect_media_garbage', dry_run=True, min_age=0, stdout=out
+        )
+        self.assertIn(f'original: {old_name}', out.getvalue())
+        self.assertIn(f'thumbnail: {stray}', out.getvalue())
+        self.assertTrue(default_storage.exists(old_name))
+
+        call_command(
+            'collect_media_garbage', min_age=0, pause=0, stdout=StringIO()
+        )
+        for name in [old_name, stray] + old_thumbnails:
+            self.assertFalse(default_storage.exists(name), name)
+        for name in [self.post.image.name] + kept_thumbnails:
+            self.assertTrue(default_storage.exists(name), name)
+
+    def test_collect_media_garbage_skips_reused(self):
+        """Файл, снова загруженный после обхода, сборщик не удаляет."""
+        content = Post.objects.get(pk=self.post.pk).image.read()
+        name = self.post.image.name
+        Post.objects.filter(pk=self.post.pk).update(image='')
+        os.utime(default_storage.path(name), (0, 0))
+        orphans = [
+            orphan
+            for batch, _, _ in media_gc.collect(min_age=60)
+            for orphan in batch
+        ]
+        self.assertIn((name, media_gc.ORIGINAL), orphans)
+        Post.objects.create(
+            author=self.author,
+            text='Та же картинка',
+            image=SimpleUploadedFile('same.gif', content, 'image/gif'),
+        )
+        self.assertFalse(
+            media_gc.delete_orphan(name, media_gc.ORIGINAL, min_age=60)
+        )
+        self.assertTrue(default_storage.exists(name))
+
+    def test_collect_media_garbage_resumes(self):
+        """Обход с --limit печатает курсор, с которого его продолжить."""
+        out = StringIO()
+        call_command(
+            'collect_media_garbage', dry_run=True, min_age=0, limit=1,
+            batch_size=1, stdout=out
+        )
+        cursor = out.getvalue().split('--after ')[1].split()[0]
+        out = StringIO()
+        call_command(
+            'collect_media_garbage', dry_run=True, min_age=0, after=cursor,
+            stdout=out
+        )
+        self.assertNotIn(cursor, out.getvalue())
+        self.assertIn('Проверено файлов', out.getvalue())
+
+
+class ImportContentTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='import_author')
+        cls.reader = User.objects.create_user(username='import_reader')
+        cls.group = Group.objects.create(title='Импорт', slug='import')
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write(text)
+        return path
+
+    def write_jsonl(self, rows):
+        return self.write('content.jsonl', '\n'.join(
+            json.dumps(row, ensure_ascii=False) for row in rows
+        ))
+
+    def test_import_jsonl(self):
+        """Импорт создаёт записи, сохраняет даты и досчитывает счётчики."""
+        path = self.write_jsonl([
+            {'type': 'post', 'id': 'a', 'author': 'import_author',
+             'text': 'Импортированный пост', 'group': 'import',
+             'pub_date': '2020-01-02T03:04:05+00:00'},
+            {'type': 'comment', 'post': 'a', 'author': 'import_reader',
+             'text': 'Комментарий', 'pub_date': '2020-01-03T00:00:00'},
+            {'type': 'follow', 'user': 'import_reader',
+             'author': 'import_author'},
+            {'type': 'post', 'id': 'b', 'author': 'nobody', 'text': 'x'},
+        ])
+        out, err = StringIO(), StringIO()
+        call_command('import_content', path, stdout=out, stderr=err)
+        self.assertIn('Постов: 1, комментариев: 1, подписок: 1, ошибок: 1',
+                      out.getvalue())
+        self.assertIn("Строка 4: нет пользователя 'nobody'", err.getvalue())
+        post = Post.objects.get(text='Импортированный пост')
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(post.comments.get().pub_date.day, 3)
+        self.assertEqual(UserStats.objects.for_user(self.author).posts_count,
+                         1)
+        found, _ = search.search('импортированный')
+        self.assertIn(post.pk, [post_id for post_id, _ in found])
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+    def test_import_skips_malformed_rows(self):
+        """Строка не-объект и несуществующая дата — ошибки строк."""
+        path = self.write('content.jsonl', '\n'.join([
+            '[1, 2]',
+            '"x"',
+            json.dumps({'type': 'post', 'id': 'a', 'author': 'import_author',
+                        'text': 'Пост', 'pub_date': '2020-13-45T00:00:00'}),
+            json.dumps({'type': 'post', 'id': 'b', 'author': 'import_author',
+                        'text': 'Целый пост'}),
+        ]))
+        out, err = StringIO(), StringIO()
+        call_command('import_content', path, stdout=out, stderr=err)
+        self.assertIn('Постов: 1, комментариев: 0, подписок: 0, ошибок: 3',
+                      out.getvalue())
+        self.assertIn('Строка 1: строка не объект JSON', err.getvalue())
+        self.assertIn('Строка 2: строка не объект JSON', err.getvalue())
+        self.assertIn("Строка 3: неверная дата '2020-13-45T00:00:00'",
+                      err.getvalue())
+        self.assertTrue(Post.objects.filter(text='Целый пост').exists())
+
+    def test_import_links_posts_across_batches(self):
+        """Комментарии и повторы id находят посты прошлых пачек в базе."""
+        path = self.write_jsonl([
+            {'type': 'post', 'id': 'a', 'author': 'import_author',
+             'text': 'Пост пачки 1'},
+            {'type': 'comment', 'post': 'a', 'author': 'import_reader',
+             'text': 'Ответ из пачки 2'},
+            {'type': 'post', 'id': 'a', 'author': 'import_author',
+             'text': 'Повтор'},
+        ])
+        err = StringIO()
+        call_command('import_content', path, batch_size=1,
+                     stdout=StringIO(), stderr=err)
+        post = Post.objects.get(text='Пост пачки 1')
+        self.assertEqual(post.comments.get().text, 'Ответ из пачки 2')
+        self.assertIn("Строка 3: повторный id поста 'a'", err.getvalue())
+        self.assertFalse(Post.objects.filter(text='Повтор').exists())
+
+    def test_import_csv_creates_users(self):
+        """CSV с --create-users заводит неизвестных авторов."""
+        path = self.write('content.csv', (
+            'type,id,author,text,group,pub_date,post,user\n'
+            'post,1,newcomer,Пост из CSV,,,,\n'
+            'comment,,newcomer,Ответ,,,1,\n'
+        ))
+        call_command(
+            'import_content', path, create_users=True, stdout=StringIO()
+        )
+        post = Post.objects.get(text='Пост из CSV')
+        self.assertEqual(post.author.username, 'newcomer')
+        self.assertFalse(post.author.has_usable_password())
+        self.assertEqual(post.comments.get().text, 'Ответ')
+
+    def test_import_resumes_after_failure(self):
+        """После сбоя импорт продолжается с последней записанной пачки.
+
+        Посты, созданные через сайт между сбоем и продолжением, не
+        мешают: id пачки выдаются при её записи.
+        """
+        path = self.write_jsonl([
+            {'type': 'post', 'id': 'a', 'author': 'import_author',
+             'text': 'Первый'},
+            {'type': 'post', 'id': 'b', 'author': 'import_author',
+             'text': 'Второй'},
+            {'type': 'comment', 'post': 'a', 'author': 'import_reader',
+             'text': 'К первому'},
+        ])
+        write_batch = importer.ContentImporter.write_batch
+        calls = []
+
+        def failing_write_batch(content, batch):
+            calls.append(batch)
+            if len(calls) == 2:
+                raise RuntimeError('сбой')
+            return write_batch(content, batch)
+
+        with mock.patch.object(
+            importer.ContentImporter, 'write_batch', failing_write_batch
+        ):
+            with self.assertRaises(RuntimeError):
+                call_command(
+                    'import_content', path, batch_size=2, stdout=StringIO()
+                )
+        self.assertEqual(Comment.objects.count(), 0)
+        with self.assertRaises(CommandError):
+            call_command('import_content', path, stdout=StringIO())
+        Post.objects.create(author=self.reader, text='С сайта')
+        call_command(
+            'import_content', path, batch_size=2, resume=True,
+            stdout=StringIO()
+        )
+        self.assertEqual(
+            Post.objects.filter(author=self.author).count(), 2
+        )
+        self.assertEqual(
+            Comment.objects.get().post, Post.objects.get(text='Первый')
+        )
+        self.assertFalse(ImportCheckpoint.objects.exists())
+        self.assertFalse(ImportedPost.objects.exists())
+
+    def test_import_position_committed_with_batch(self):
+        """Сбой сразу после коммита пачки не повторяет её строки."""
+        path = self.write_jsonl([
+            {'type': 'post', 'id': 'a', 'author': 'import_author',
+             'text': 'Первый'},
+            {'type': 'comment', 'post': 'a', 'author': 'import_reader',
+             'text': 'К первому'},
+            {'type': 'follow', 'user': 'import_reader',
+             'author': 'import_author'},
+        ])
+        with mock.patch.object(
+            importer.ContentImporter, 'forget_feeds',
+            side_effect=RuntimeError('сбой')
+        ):
+            with self.assertRaises(RuntimeError):
+                call_command(
+                    'import_content', path, batch_size=2, stdout=StringIO()
+                )
+        call_command(
+            'import_content', path, batch_size=2, resume=True,
+            stdout=StringIO()
+        )
+        post = Post.objects.get(text='Первый')
+        self.assertEqual(post.comments.count(), 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1
+        )
+        self.assertTrue(
+            Timeline.objects.filter(user=self.reader, post=post).exists()
+        )
+
+
+class DumpRestoreTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='dump_author')
+        cls.reader = User.objects.create_user(username='dump_reader')
+        cls.group = Group.objects.create(title='Выгрузка', slug='dump')
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {i}'
+            )
+            for i in range(5)
+        ]
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def snapshot(self):
+        return [
+            list(model.objects.order_by('pk').values_list())
+            for model in dump.get_models()
+        ]
+
+    def test_dump_and_restore(self):
+        """Восстановленная база совпадает с выгруженной."""
+        before = self.snapshot()
+        call_command(
+            'dump_content', self.directory, chunk_rows=2, stdout=StringIO()
+        )
+        with open(os.path.join(self.directory, dump.MANIFEST)) as source:
+            manifest = json.load(source)
+        posts = next(
+            entry for entry in manifest['models']
+            if entry['model'] == 'posts.post'
+        )
+        self.assertEqual(posts['rows'], 5)
+        self.assertEqual(len(posts['files']), 3)
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        call_command(
+            'restore_content', self.directory, workers=1, stdout=StringIO()
+        )
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(
+            UserStats.objects.for_user(self.author).posts_count, 5
+        )
+        found, _ = search.search('пост')
+        self.assertEqual(len(found), 5)
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 5)
+
+    def test_restore_keeps_indexes(self):
+        """Отложенные индексы создаются заново после загрузки."""
+        def indexes():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' "
+                    "AND tbl_name = 'posts_post' ORDER BY name"
+                )
+                return cursor.fetchall()
+
+        before = indexes()
+        dump.dump(self.directory)
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        dump.restore(self.directory)
+        self.assertEqual(indexes(), before)
+
+    def test_restore_requires_empty_database(self):
+        """В непустую базу выгрузка не восстанавливается."""
+        dump.dump(self.directory)
+        with self.assertRaisesMessage(CommandError, 'не пуста'):
+            call_command('restore_content', self.directory, workers=1)
+
+
+class SyndicationFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_feed')
+        cls.group = Group.objects.create(
+            title='Лента',
+            slug='feed_slug',
+            description='Описание ленты',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Пост для ленты',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.urls = [
+            reverse(name, kwargs=kwargs)
+            for kind, kwargs in (
+                ('index', {}),
+                ('group', {'slug': self.group.slug}),
+                ('profile', {'username': self.author.username}),
+            )
+            for name in (f'posts:{kind}_rss', f'posts:{kind}_atom')
+        ]
+
+    def test_feeds_contain_post(self):
+        """Ленты RSS и Atom отдают пост со ссылкой на него."""
+        link = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('xml', response['Content-Type'])
+                self.assertContains(response, 'Пост для ленты')
+                self.assertContains(response, link)
+
+    def test_feed_cached_and_not_modified(self):
+        """Лента кэшируется и отвечает 304 по ETag и Last-Modified."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response['X-Page-Cache'], 'miss')
+                self.assertEqual(
+                    self.guest_client.get(url)['X-Page-Cache'], 'hit'
+                )
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag']
+                )
+                self.assertEqual(response.status_code, 304)
+                response = self.guest_client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+                )
+                self.assertEqual(response.status_code, 304)
+
+    def test_feed_invalidated_on_new_post(self):
+        """Новый пост сбрасывает кэш и валидатор ленты."""
+        etags = {url: self.guest_client.get(url)['ETag'] for url in self.urls}
+        Post.objects.create(
+            author=self.author, group=self.group, text='Свежий пост'
+        )
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Свежий пост')
+
+    def test_unknown_group_feed(self):
+        """Лента несуществующей группы отвечает 404."""
+        response = self.guest_client.get(
+            reverse('posts:group_rss', kwargs={'slug': 'missing'})
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_card')
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Карточка {i}')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(
+            User.objects.create_user(username='reader_card')
+        )
+
+    def card_cached(self, post):
+        post.refresh_from_db()
+        return cache.get(
+            cards.card_key(post, cards.get_cards_version())
+        ) is not None
+
+    def test_cards_cached(self):
+        """Карточки постов ленты кэшируются по версии поста."""
+        self.guest_client.get(reverse('posts:index'))
+        for post in self.posts:
+            with self.subTest(post=post.pk):
+                self.assertTrue(self.card_cached(post))
+
+    def test_edit_invalidates_one_card(self):
+        """Правка поста сбрасывает только его карточку."""
+        self.guest_client.get(reverse('posts:index'))
+        edited, other = self.posts[0], self.posts[1]
+        edited.text = 'Исправленная карточка'
+        edited.save()
+        self.assertFalse(self.card_cached(edited))
+        self.assertTrue(self.card_cached(other))
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Исправленная карточка')
+        self.assertTrue(self.card_cached(edited))
+
+    def test_rename_invalidates_cards(self):
+        """Переименование автора сбрасывает его карточки."""
+        self.guest_client.get(reverse('posts:index'))
+        author = User.objects.get(pk=self.author.pk)
+        author.username = 'renamed_card'
+        author.first_name = 'Новое'
+        author.save()
+        self.assertFalse(self.card_cached(self.posts[0]))
+        for client in (self.guest_client, self.authorized_client):
+            with self.subTest(client=client):
+                response = client.get(reverse('posts:index'))
+                self.assertContains(response, 'Новое')
+                self.assertContains(response, reverse(
+                    'posts:profile', args=('renamed_card',)
+                ))
+                self.assertNotContains(response, '/author_card/')
+
+    def test_login_keeps_cards(self):
+        """Вход пользователя не сбрасывает карточки."""
+        self.guest_client.get(reverse('posts:index'))
+        self.authorized_client.force_login(self.author)
+        self.assertTrue(self.card_cached(self.posts[0]))
+
+    def test_fast_reverse(self):
+        """Ссылки по разобранным шаблонам совпадают с reverse()."""
+        cases = (
+            ('posts:profile', 'user.name+1'),
+            ('posts:profile', 'пользователь'),
+            ('posts:group_list', 'my-group'),
+            ('posts:post_detail', 42),
+        )
+        for name, arg in cases:
+            with self.subTest(name=name, arg=arg):
+                self.assertEqual(
+                    cards.fast_reverse(name, arg), reverse(name, args=[arg])
+                )
+
+    def test_benchmark_command(self):
+        """Замер рендера карточек проходит и откатывает свои данные."""
+        out = StringIO()
+        posts_count = Post.objects.count()
+        call_command('benchmark_cards', posts=2, repeat=1, stdout=out)
+        for page in ('index', 'group_list', 'profile', 'follow'):
+            self.assertIn(f'{page}.html', out.getvalue())
+        self.assertEqual(Post.objects.count(), posts_count)
+
+    def test_comment_changes_version(self):
+        """Новый комментарий меняет версию карточки: в ней счётчик."""
+        post = self.posts[0]
+        version = post.version
+        Comment.objects.create(post=post, author=self.author, text='Ответ')
+        post.refresh_from_db()
+        self.assertNotEqual(post.version, version)
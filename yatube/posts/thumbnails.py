@@ -0,0 +1,267 @@
+import base64
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from PIL import Image, ImageOps
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDbKVStore
+)
+from sorl.thumbnail.models import KVStore
+
+from .storage import is_content_name
+
+logger = logging.getLogger(__name__)
+
+# Ширины вариантов картинки; пропорции карточки — 960x339.
+IMAGE_WIDTHS = (480, 960)
+IMAGE_ASPECT = (960, 339)
+# Первый формат — основной, последний — запасной для старых браузеров.
+IMAGE_FORMATS = ('WEBP', 'JPEG')
+# Превью-заглушка с пропорциями карточки, растягивается браузером.
+PLACEHOLDER_SIZE = (16, 6)
+PLACEHOLDER_QUALITY: int = 50
+THUMBNAIL_WORKERS: int = 2
+THUMBNAIL_QUEUE_SIZE: int = 100
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(
+    getattr(settings, 'POSTS_THUMBNAIL_QUEUE_SIZE', THUMBNAIL_QUEUE_SIZE)
+)
+
+
+def get_widths():
+    return sorted(getattr(settings, 'POSTS_IMAGE_WIDTHS', IMAGE_WIDTHS))
+
+
+def get_height(width):
+    return round(width * IMAGE_ASPECT[1] / IMAGE_ASPECT[0])
+
+
+def get_spec(width, image_format):
+    """Геометрия и опции sorl для варианта картинки."""
+    geometry = '{}x{}'.format(width, get_height(width))
+    return geometry, {'crop': 'center', 'upscale': True,
+                      'format': image_format}
+
+
+def get_specs():
+    return [
+        get_spec(width, image_format)
+        for image_format in IMAGE_FORMATS
+        for width in get_widths()
+    ]
+
+
+def get_variants(image_name):
+    """Миниатюры картинки по форматам: {format: [(width, thumbnail)]}."""
+    variants = {}
+    for image_format in IMAGE_FORMATS:
+        variants[image_format] = []
+        for width in get_widths():
+            geometry, options = get_spec(width, image_format)
+            variants[image_format].append(
+                (width, get_thumbnail(image_name, geometry, **options))
+            )
+    return variants
+
+
+def thumbnail_name(image_name, geometry, options):
+    """Имя миниатюры, которое выберет get_thumbnail, без обращений к kvstore.
+
+    Повторяет подготовку опций из ThumbnailBackend.get_thumbnail
+    sorl-thumbnail 12.7 (версия закреплена в requirements.txt) и
+    вызывает его _get_thumbnail_filename; совпадение имён с
+    get_thumbnail проверяют тесты. Формат в наших опциях задан всегда.
+    """
+    backend = default.backend
+    options = dict(options)
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    return backend._get_thumbnail_filename(
+        ImageFile(image_name), geometry, options
+    )
+
+
+def _load_thumbnails(keys):
+    """Записи kvstore по ключам: кэш одним get_many, промахи — одним запросом.
+
+    Возвращает {ключ: ImageFile}; ненайденных ключей в ответе нет.
+    """
+    kvstore = default.kvstore
+    raw = {
+        key: value for key, value in kvstore.cache.get_many(keys).items()
+        if value != EMPTY_VALUE
+    }
+    missing = [key for key in keys if key not in raw]
+    if missing:
+        found = dict(
+            KVStore.objects.filter(key__in=missing)
+            .values_list('key', 'value')
+        )
+        kvstore.cache.set_many(
+            found, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        raw.update(found)
+    return {key: deserialize_image_file(value) for key, value in raw.items()}
+
+
+def get_many_variants(image_names):
+    """get_variants для картинок всей страницы за пару обращений к kvstore.
+
+    Картинки, у которых нашлись не все миниатюры, проходят обычный
+    get_thumbnail: он создаст недостающие.
+    """
+    image_names = set(image_names)
+    if not isinstance(default.kvstore, CachedDbKVStore):
+        return {name: get_variants(name) for name in image_names}
+    wanted = {}
+    for name in image_names:
+        for image_format in IMAGE_FORMATS:
+            for width in get_widths():
+                thumbnail = ImageFile(
+                    thumbnail_name(name, *get_spec(width, image_format)),
+                    default.storage,
+                )
+                wanted[add_prefix(thumbnail.key)] = (name, image_format, width)
+    found = _load_thumbnails(list(wanted))
+    variants = {}
+    for key, (name, image_format, width) in wanted.items():
+        variants.setdefault(name, {}).setdefault(image_format, [])
+        if key in found:
+            variants[name][image_format].append((width, found[key]))
+    for name in image_names:
+        if any(
+            len(variants[name][image_format]) != len(get_widths())
+            for image_format in IMAGE_FORMATS
+        ):
+            variants[name] = get_variants(name)
+    return variants
+
+
+def describe(image_file):
+    """Основной цвет и размытое превью картинки (data URI).
+
+    Считается один раз при загрузке, чтобы лента рисовала заглушку,
+    не открывая исходный файл.
+    """
+    image_file.seek(0)
+    with Image.open(image_file) as image:
+        # Для JPEG декодер сразу уменьшает картинку, это в разы быстрее.
+        image.draft('RGB', (PLACEHOLDER_SIZE[0] * 8, PLACEHOLDER_SIZE[1] * 8))
+        preview = ImageOps.fit(image.convert('RGB'), PLACEHOLDER_SIZE)
+    image_file.seek(0)
+    color = '#{:02x}{:02x}{:02x}'.format(
+        *preview.resize((1, 1), Image.BOX).getpixel((0, 0))
+    )
+    buffer = io.BytesIO()
+    preview.save(buffer, 'JPEG', quality=PLACEHOLDER_QUALITY)
+    placeholder = 'data:image/jpeg;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+    return color, placeholder
+
+
+def get_workers():
+    """Число потоков фоновой генерации; 0 — генерировать сразу."""
+    return getattr(settings, 'POSTS_THUMBNAIL_WORKERS', THUMBNAIL_WORKERS)
+
+
+def generate(image_name):
+    """Создаёт недостающие миниатюры картинки, возвращает их имена."""
+    return [
+        get_thumbnail(image_name, geometry, **options).name
+        for geometry, options in get_specs()
+    ]
+
+
+def is_stale(source_name, thumbnail):
+    storage = default.storage
+    if not thumbnail.exists():
+        return True
+    if is_content_name(source_name):
+        # Содержимое файла с именем по хэшу не меняется, а дату
+        # изменения обновляет повторная загрузка того же файла.
+        return False
+    return (
+        storage.get_modified_time(thumbnail.name)
+        < storage.get_modified_time(source_name)
+    )
+
+
+def regenerate(image_name):
+    """Создаёт отсутствующие и пересоздаёт устаревшие миниатюры картинки.
+
+    Возвращает число созданных миниатюр.
+    """
+    if default.kvstore.get(ImageFile(image_name)) is None:
+        # Картинки нет в хранилище ключей: миниатюр у неё ещё не было.
+        return len(generate(image_name))
+    count = 0
+    for geometry, options in get_specs():
+        thumbnail = get_thumbnail(image_name, geometry, **options)
+        if not is_stale(image_name, thumbnail):
+            continue
+        default.kvstore.delete(thumbnail)
+        if thumbnail.exists():
+            thumbnail.delete()
+        get_thumbnail(image_name, geometry, **options)
+        count += 1
+    return count
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_workers(),
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def _run(image_name):
+    try:
+        generate(image_name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры %s', image_name)
+    finally:
+        _slots.release()
+        # Соединения с БД открываются в потоке пула и сами не закрываются.
+        connections.close_all()
+
+
+def schedule(image_name):
+    """Ставит генерацию миниатюр в фоновый пул.
+
+    Если очередь переполнена, задача отбрасывается: миниатюру создаст
+    тег {% thumbnail %} при первом показе.
+    """
+    if get_workers() == 0:
+        generate(image_name)
+        return True
+    if not _slots.acquire(blocking=False):
+        logger.warning('Очередь миниатюр переполнена, %s пропущен',
+                       image_name)
+        return False
+    try:
+        _get_executor().submit(_run, image_name)
+    except RuntimeError:
+        # Пул уже остановлен: интерпретатор завершает работу.
+        _slots.release()
+        return False
+    return True
@@ -0,0 +1,72 @@
+from collections import defaultdict
+
+from .models import Follow, Post, Timeline
+
+BATCH_SIZE: int = 500
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    Timeline.objects.bulk_create(
+        (
+            Timeline(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_posts(posts):
+    """Как fan_out_post, но для пачки постов: подписчики — одним запросом."""
+    followers = defaultdict(list)
+    follows = Follow.objects.filter(
+        author_id__in={post.author_id for post in posts}
+    ).values_list('author_id', 'user_id')
+    for author_id, user_id in follows.iterator():
+        followers[author_id].append(user_id)
+    Timeline.objects.bulk_create(
+        (
+            Timeline(user_id=user_id, post_id=post.pk, pub_date=post.pub_date)
+            for post in posts
+            for user_id in followers[post.author_id]
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту читателя все посты автора после подписки."""
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('pk', 'pub_date')
+    Timeline.objects.bulk_create(
+        (
+            Timeline(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты читателя посты автора после отписки."""
+    Timeline.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def rebuild():
+    """Пересобирает ленты всех читателей с нуля, возвращает число подписок."""
+    Timeline.objects.all().delete()
+    follows = Follow.objects.values_list('user_id', 'author_id')
+    count = 0
+    for user_id, author_id in follows.iterator():
+        backfill(user_id, author_id)
+        count += 1
+    return count
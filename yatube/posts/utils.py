@@ -1,13 +1,281 @@
+import base64
+import collections.abc
+import time
+
+from django.conf import settings
+from django.core.cache import cache
 from django.core.paginator import Paginator
+from django.db.models import F, Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 
 
 LAST_NUM_POSTS: int = 10
+LAST_NUM_COMMENTS: int = 20
+PAGE_WINDOW: int = 2
+# Поля ключа курсора по умолчанию: дата и id записи.
+CURSOR_FIELDS = ('pub_date', 'pk')
+# Аннотации, в которые CursorPaginator копирует поля ключа.
+CURSOR_KEY = ('cursor_date', 'cursor_pk')
+COUNT_CACHE_TIMEOUT: int = 60 * 60
+
+
+def feed_count_key(feed, pk=None):
+    """Ключ кэша с количеством постов в ленте: index, group, author."""
+    if pk is None:
+        return f'posts:count:{feed}'
+    return f'posts:count:{feed}:{pk}'
+
+
+def feed_version_key(feed, pk=None):
+    """Ключ версии кэша: all, index, group, author или post."""
+    if pk is None:
+        return f'posts:version:{feed}'
+    return f'posts:version:{feed}:{pk}'
+
+
+def get_versions(keys):
+    """Текущие версии ключей; отсутствующие получают новую версию."""
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return versions
+
+
+def get_feed_version(feed, pk=None):
+    """Версия фрагмента ленты для ключа тега {% cache %}.
+
+    Складывается из общей версии и версии самой ленты, поэтому
+    фрагмент можно кэшировать бессрочно.
+    """
+    keys = [feed_version_key('all'), feed_version_key(feed, pk)]
+    versions = get_versions(keys)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def bump_feed_versions(keys):
+    """Выдаёт лентам новые версии, старые фрагменты больше не читаются."""
+    version = time.time_ns()
+    cache.set_many({key: version for key in keys}, None)
+
+
+def get_cached_count(count_key, queryset):
+    return cache.get_or_set(count_key, queryset.count, COUNT_CACHE_TIMEOUT)
+
+
+def encode_cursor(obj, fields=CURSOR_FIELDS):
+    """Упаковывает ключ (дата, id) записи в непрозрачный токен."""
+    date_field, pk_field = fields
+    raw = f'{getattr(obj, date_field).isoformat()}|{getattr(obj, pk_field)}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора, для битого токена возвращает None."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        pub_date, pk = raw.rsplit('|', 1)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (ValueError, UnicodeError, TypeError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class FeedPaginator(Paginator):
+    """Paginator с кэшированным COUNT(*) и окном номеров страниц."""
+
+    def __init__(self, object_list, per_page, count_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return Paginator.count.func(self)
+        return get_cached_count(self.count_key, self.object_list)
+
+    def get_page_window(self, number):
+        """Первая, последняя и соседние с number страницы.
+
+        Пропуски между ними обозначены None.
+        """
+        last = self.num_pages
+        numbers = {1, last}
+        numbers.update(range(
+            max(number - PAGE_WINDOW, 1),
+            min(number + PAGE_WINDOW, last) + 1
+        ))
+        window = []
+        for page_number in sorted(numbers):
+            if window and page_number - window[-1] > 1:
+                window.append(None)
+            window.append(page_number)
+        return window
+
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        page.page_window = self.get_page_window(page.number)
+        return page
+
+
+class CursorPage(collections.abc.Sequence):
+    """Страница ленты, построенная по курсору вместо номера страницы."""
 
+    number = None
 
-def get_paginator(request, set_posts):
+    def __init__(self, object_list, paginator, cursor='',
+                 next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
 
-    paginator = Paginator(set_posts, LAST_NUM_POSTS)
+    def __repr__(self):
+        return f'<Cursor page {self.cursor or "first"}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset-пагинация по (дата, id): без COUNT(*) и OFFSET.
+
+    fields — поля ключа, в том числе через связь, по умолчанию
+    (pub_date, pk).
+    """
+
+    cursor_mode = True
+
+    def __init__(self, object_list, per_page, count_key=None,
+                 fields=CURSOR_FIELDS):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.count_key = count_key
+        self.fields = fields
+
+    @cached_property
+    def keyed_list(self):
+        """object_list с полями ключа в аннотациях CURSOR_KEY.
+
+        Аннотация переиспользует JOIN из фильтра object_list, а
+        отдельный filter() по связи «ко многим» добавил бы второй.
+        """
+        return self.object_list.annotate(**{
+            name: F(field) for name, field in zip(CURSOR_KEY, self.fields)
+        })
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return self.object_list.count()
+        return get_cached_count(self.count_key, self.object_list)
+
+    def _page(self, items, cursor, has_newer, has_older):
+        return CursorPage(
+            items,
+            self,
+            cursor=cursor,
+            next_cursor=(
+                encode_cursor(items[-1], CURSOR_KEY) if has_older else None
+            ),
+            previous_cursor=(
+                encode_cursor(items[0], CURSOR_KEY) if has_newer else None
+            ),
+        )
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу после курсора after или перед before.
+
+        Битый или отсутствующий курсор отдаёт первую страницу.
+        """
+        limit = self.per_page + 1
+        key = decode_cursor(before) if before else None
+        if key is not None:
+            items = list(
+                self.keyed_list.filter(self._key_filter(key, 'gt'))
+                .order_by(*CURSOR_KEY)[:limit]
+            )
+            has_newer = len(items) > self.per_page
+            items = items[:self.per_page][::-1]
+            if items:
+                return self._page(items, before, has_newer, True)
+        key = decode_cursor(after) if after else None
+        items = self._older(key, limit)
+        if key is not None and not items:
+            key, items = None, self._older(None, limit)
+        has_older = len(items) > self.per_page
+        items = items[:self.per_page]
+        if key is None:
+            return self._page(items, '', False, has_older)
+        return self._page(items, after, True, has_older)
+
+    def _key_filter(self, key, lookup):
+        """Условие «ключ записи строго gt/lt key»."""
+        date_field, pk_field = CURSOR_KEY
+        date, pk = key
+        return (
+            Q(**{f'{date_field}__{lookup}': date})
+            | Q(**{date_field: date, f'{pk_field}__{lookup}': pk})
+        )
+
+    def _older(self, key, limit):
+        queryset = self.keyed_list.order_by(
+            *(f'-{name}' for name in CURSOR_KEY)
+        )
+        if key is not None:
+            queryset = queryset.filter(self._key_filter(key, 'lt'))
+        return list(queryset[:limit])
+
+
+def get_paginator(request, set_posts, count_key=None,
+                  cursor_fields=CURSOR_FIELDS):
+    after = request.GET.get('after')
+    before = request.GET.get('before')
     page_number = request.GET.get('page')
+
+    mode = getattr(settings, 'POSTS_PAGINATION_MODE', 'page')
+
+    cursor_allowed = isinstance(set_posts, QuerySet)
+
+    if cursor_allowed and (
+        after or before or (mode == 'cursor' and not page_number)
+    ):
+        paginator = CursorPaginator(
+            set_posts, LAST_NUM_POSTS, count_key, cursor_fields
+        )
+        return paginator.get_page(after=after, before=before)
+
+    paginator = FeedPaginator(set_posts, LAST_NUM_POSTS, count_key)
     page_obj = paginator.get_page(page_number)
 
     return page_obj
+
+
+def get_comments_page(request, post):
+    """Порция комментариев поста после курсора ?after=."""
+    paginator = CursorPaginator(
+        post.comments.select_related('author').only(
+            'text', 'pub_date', 'post_id', 'author__username'
+        ),
+        LAST_NUM_COMMENTS,
+    )
+    return paginator.get_page(after=request.GET.get('after'))
@@ -2,65 +2,140 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user
 
+from . import conditional, search
+from .follow_feed import get_cursor_fields, get_follow_feed
 from .forms import PostForm, CommentForm
-from .models import Post, Group, User, Follow
-from .utils import get_paginator
+from .models import Post, Group, User, Follow, UserStats
+from .page_cache import cache_anonymous_page
+from .utils import (
+    feed_count_key, feed_version_key, get_comments_page, get_feed_version,
+    get_paginator
+)
 
 
+@conditional.feed_condition(conditional.index_keys)
+@cache_anonymous_page
+@conditional.read_from_replica
 def index(request):
-    posts = Post.objects.all()
-    page_obj = get_paginator(request, posts)
+    posts = Post.objects.for_feed()
+    page_obj = get_paginator(request, posts, feed_count_key('index'))
     context = {
         'page_obj': page_obj,
+        'feed_version': get_feed_version('index'),
     }
-    return render(request, 'posts/index.html', context)
+    response = render(request, 'posts/index.html', context)
+    response.surrogate_keys = [feed_version_key('index')]
+    return response
 
 
+@conditional.feed_condition(conditional.group_keys)
+@cache_anonymous_page
+@conditional.read_from_replica
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = get_paginator(request, posts)
+    posts = group.posts.for_feed()
+    page_obj = get_paginator(
+        request, posts, feed_count_key('group', group.pk)
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
+        'feed_version': get_feed_version('group', group.pk),
     }
-    return render(request, 'posts/group_list.html', context)
+    response = render(request, 'posts/group_list.html', context)
+    response.surrogate_keys = [feed_version_key('group', group.pk)]
+    return response
 
 
+@conditional.feed_condition(conditional.profile_keys)
+@cache_anonymous_page
+@conditional.read_from_replica
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    page_obj = get_paginator(request, posts)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    posts = author.posts.for_feed()
+    page_obj = get_paginator(
+        request, posts, feed_count_key('author', author.pk)
+    )
     following = (
         request.user.is_authenticated
         and Follow.objects.filter(user=request.user, author=author).exists()
     )
     context = {
         'author': author,
+        'author_stats': UserStats.objects.for_user(author),
         'page_obj': page_obj,
+        'feed_version': get_feed_version('author', author.pk),
         'following': following,
     }
-    return render(request, 'posts/profile.html', context)
+    response = render(request, 'posts/profile.html', context)
+    response.surrogate_keys = [feed_version_key('author', author.pk)]
+    return response
 
 
+@conditional.feed_condition(conditional.post_keys)
+@cache_anonymous_page
+@conditional.read_from_replica
 def post_detail(request, post_id):
     form = CommentForm(request.POST or None)
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
     group = post.group
-    comments = post.comments.all()
+    comments = get_comments_page(request, post)
     context = {
         'post': post,
+        'author_stats': UserStats.objects.for_user(post.author),
         'group': group,
         'form': form,
         'comments': comments,
     }
-    return render(request, 'posts/post_detail.html', context)
+    response = render(request, 'posts/post_detail.html', context)
+    response.surrogate_keys = [
+        feed_version_key('post', post.pk),
+        feed_version_key('author', post.author_id),
+    ]
+    return response
+
+
+@conditional.feed_condition(conditional.post_keys)
+@cache_anonymous_page
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    context = {
+        'post': post,
+        'comments': get_comments_page(request, post),
+    }
+    response = render(request, 'posts/includes/comment_list.html', context)
+    response.surrogate_keys = [feed_version_key('post', post.pk)]
+    return response
+
+
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    results, next_cursor = search.search(query, request.GET.get('after'))
+    posts = Post.objects.for_feed().in_bulk(
+        [post_id for post_id, _ in results]
+    )
+    context = {
+        'query': query,
+        'results': [
+            (posts[post_id], snippet)
+            for post_id, snippet in results if post_id in posts
+        ],
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'posts/search.html', context)
 
 
 @login_required
+@conditional.read_from_replica
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = get_paginator(request, post_list)
+    post_list = get_follow_feed(request.user)
+    page_obj = get_paginator(
+        request, post_list, cursor_fields=get_cursor_fields()
+    )
     context = {
         'page_obj': page_obj
     }
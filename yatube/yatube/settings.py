@@ -71,6 +71,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'core.routers.PrimaryPinMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -103,9 +104,40 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живёт между запросами, PRAGMA выставляются один раз.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
     }
 }
 
+# Реплики для чтения лент (core.routers), файлы SQLite через запятую:
+# DB_REPLICAS=replica1.sqlite3,replica2.sqlite3. Локально их обновляет
+# manage.py replicate_sqlite --interval 1; отметки о копировании она
+# оставляет в кэше, поэтому нужен общий кэш (CACHE_LOCATION). После
+# записи пользователь читает с основной базы, пока реплики её не получат.
+DATABASE_REPLICAS = []
+for replica_name in filter(None, os.getenv('DB_REPLICAS', '').split(',')):
+    DATABASE_REPLICAS.append(f'replica{len(DATABASE_REPLICAS) + 1}')
+    DATABASES[DATABASE_REPLICAS[-1]] = dict(
+        DATABASES['default'],
+        NAME=os.path.join(BASE_DIR, replica_name),
+        TEST={'MIRROR': 'default'},
+    )
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+DATABASE_REPLICA_MAX_LAG = 30
+
+# PRAGMA для каждого нового соединения с SQLite (core.db). WAL: чтение
+# не ждёт записи; synchronous=normal в WAL не теряет целостность, только
+# последние транзакции при отключении питания; busy_timeout — сколько мс
+# писатель ждёт блокировку; cache_size в минусе — размер в КиБ.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32 * 1024,
+    'temp_store': 'memory',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -160,8 +192,46 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# 'page' — номера страниц (?page=N), 'cursor' — курсоры (?after=/?before=).
+POSTS_PAGINATION_MODE = 'page'
+
+# Движок ленты подписок: 'join' — запрос через Follow, 'timeline' —
+# материализованные ленты, 'pull' — слияние кэшей свежих постов авторов.
+# После переключения на 'timeline' выполните manage.py rebuild_timelines,
+# на 'pull' — очистите кэш: другие движки списки постов не обновляют.
+POSTS_FOLLOW_FEED_ENGINE = 'timeline'
+
+# Потоки фоновой генерации миниатюр после загрузки картинки;
+# 0 — генерировать сразу после коммита, в процессе обработки запроса.
+POSTS_THUMBNAIL_WORKERS = 2
+
+# Ширины вариантов картинки поста для srcset, в WebP и JPEG.
+POSTS_IMAGE_WIDTHS = (480, 960)
+
+# Общий для всех процессов кэш: каталог CACHE_LOCATION или сетевой кэш
+# из CACHE_BACKEND. Без них — память процесса: в разработке и тестах
+# процесс один, и данные прошлых запусков не переживают перезапуск.
+CACHE_LOCATION = os.getenv('CACHE_LOCATION')
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TieredCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_BYTES': 16 * 1024 * 1024,
+            # Версии лент сбрасывают кэш страниц, их читаем только из
+            # общего кэша, чтобы все процессы видели правку сразу. Так
+            # же и отметки синхронизации реплик.
+            'LOCAL_EXCLUDE': ('posts:version:', 'core:replica:'),
+        },
+    },
+    'shared': {
+        'BACKEND': os.getenv('CACHE_BACKEND', (
+            'django.core.cache.backends.filebased.FileBasedCache'
+            if CACHE_LOCATION
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        )),
+        'LOCATION': CACHE_LOCATION or 'shared',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
 }